@@ -0,0 +1,149 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chess import Board
+from evaluation import evaluate
+import instrumentation
+from search import Searcher
+
+
+FIELDS = ['line', 'id', 'fen', 'legal_moves', 'status', 'eval', 'best_move', 'score', 'depth', 'error']
+EPD_ID_PATTERN = re.compile(r'\bid\s+"([^"]*)"')
+
+
+def parse_position(line: str):
+    "FEN and id of a FEN or EPD line, EPD lines get the default halfmove and fullmove clocks"
+    fields = line.split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return ' '.join(fields[:6]), None
+    match = EPD_ID_PATTERN.search(line)
+    return ' '.join(fields[:4] + ['0', '1']), match.group(1) if match else None
+
+
+def analyze_position(line_number: int, line: str, depth=0, searcher: Searcher = None) -> dict:
+    "Legal move count, Board.status, static eval and an optional shallow search of one position"
+    fen, position_id = parse_position(line)
+    result = dict.fromkeys(FIELDS)
+    result.update(line=line_number, id=position_id, fen=fen)
+    try:
+        board = Board(fen, quiet=True)
+    except (ValueError, IndexError, KeyError) as e:
+        result['status'] = 'error'
+        result['error'] = f'Invalid position: {e}'
+        return result
+
+    result['legal_moves'] = len(board.get_legal_moves())
+    # The same status the server and the validator report
+    result['status'] = board.status()
+    result['eval'] = evaluate(board)
+
+    if depth and not board.in_mate:
+        found = (searcher or Searcher()).search(board, depth=depth)
+        result['best_move'] = found.move.to_uci()
+        result['score'] = found.score
+        result['depth'] = found.depth
+    return result
+
+
+# Every worker process reuses one searcher and its transposition table
+_searcher: Searcher = None
+
+
+def _analyze_chunk(chunk: list[tuple[int, str]], depth: int) -> list[dict]:
+    global _searcher
+    if depth and _searcher is None:
+        _searcher = Searcher()
+    return [analyze_position(number, line, depth, _searcher) for number, line in chunk]
+
+
+def _read_chunks(lines, chunk_size: int):
+    chunk = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        chunk.append((number, line))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def analyze_lines(lines, depth=0, workers=None, chunk_size=256):
+    """
+    Yields the analysis of every position in input order. Chunks of lines are spread over a process pool,
+    with at most two chunks per worker in flight so memory stays bounded on large files.
+    """
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _read_chunks(lines, chunk_size):
+            pending.append(pool.submit(_analyze_chunk, chunk, depth))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class _CSVWriter:
+    def __init__(self, out):
+        self.writer = csv.DictWriter(out, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def write(self, result):
+        self.writer.writerow(result)
+
+
+class _JSONLWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, result):
+        self.out.write(json.dumps({k: v for k, v in result.items() if v is not None}) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Label every position of an EPD/FEN file using a process pool')
+    parser.add_argument('input', help='file with one FEN or EPD position per line')
+    parser.add_argument('--out', help='output file, stdout if not given')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='defaults to the output file extension, else jsonl')
+    parser.add_argument('--depth', type=int, default=0, help='depth of the optional search per position')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=256)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.profiling(args.profile, args.stats):
+        output_format = args.format or ('csv' if args.out and args.out.endswith('.csv') else 'jsonl')
+        out = open(args.out, 'w', newline='') if args.out else sys.stdout
+        writer = _CSVWriter(out) if output_format == 'csv' else _JSONLWriter(out)
+
+        count = errors = 0
+        start = time.perf_counter()
+        with open(args.input) as f:
+            for result in analyze_lines(f, args.depth, args.workers, args.chunk_size):
+                writer.write(result)
+                count += 1
+                errors += result['status'] == 'error'
+        elapsed = time.perf_counter() - start
+        if args.out:
+            out.close()
+
+        print(
+            f'Positions: {count} ({errors} errors) in {elapsed:.3f}s '
+            f'({count / elapsed if elapsed else 0:.0f} positions/s, {args.workers} workers)',
+            file=sys.stderr
+        )
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
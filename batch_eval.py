@@ -0,0 +1,211 @@
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from chess import Board
+from evaluation import SQUARE_SCORES
+
+
+# Order of the piece planes, white pieces first
+PLANE_SYMBOLS = 'PNBRQKpnbrqk'
+
+# Material and piece-square score of every plane and square, signed for white
+SQUARE_SCORE_PLANES = np.array([SQUARE_SCORES[symbol] for symbol in PLANE_SYMBOLS], dtype=np.int32)
+
+MOBILITY_WEIGHT = 3
+DOUBLED_PAWN_PENALTY = 10
+ISOLATED_PAWN_PENALTY = 15
+# Passed pawn bonus by row from white's point of view, rank 8 first
+PASSED_PAWN_BONUS = np.array([0, 100, 60, 35, 20, 10, 5, 0], dtype=np.int32)
+
+def encode_bitboards(bitboards: list[list[int]]) -> np.ndarray:
+    "Turns rows of 12 piece bitboards (in PLANE_SYMBOLS order) into a (N, 12, 64) uint8 array"
+    ints = np.array(bitboards, dtype=np.uint64).reshape(-1, 12)
+    # Little endian bytes, so bit i of every integer lands on square i
+    as_bytes = ints.astype('<u8').view(np.uint8).reshape(-1, 12, 8)
+    return np.unpackbits(as_bytes, axis=-1, bitorder='little')
+
+
+def encode_boards(boards: list[Board]):
+    "Piece planes (N, 12, 64) and side to move (N,), +1 for white and -1 for black"
+    planes = encode_bitboards([[b.bitboards.pieces[s] for s in PLANE_SYMBOLS] for b in boards])
+    turns = np.array([1 if b.turn == 'WHITE' else -1 for b in boards], dtype=np.int32)
+    return planes, turns
+
+
+def _fen_bitboards(fen: str):
+    placement, turn = fen.split()[:2]
+    bitboards = dict.fromkeys(PLANE_SYMBOLS, 0)
+    sq = 0
+    for char in placement:
+        if char == '/':
+            continue
+        if char.isdigit():
+            sq += int(char)
+        else:
+            bitboards[char] |= 1 << sq
+            sq += 1
+    return [bitboards[s] for s in PLANE_SYMBOLS], 1 if turn == 'w' else -1
+
+
+def encode_fens(fens: list[str]):
+    "Same as encode_boards, straight from FEN strings without building a Board"
+    parsed = [_fen_bitboards(fen) for fen in fens]
+    planes = encode_bitboards([p[0] for p in parsed])
+    turns = np.array([p[1] for p in parsed], dtype=np.int32)
+    return planes, turns
+
+
+# Bitboard shifts as (amount, wrap mask), positive amounts shift towards higher squares.
+# Squares follow Board.board order (a8 = 0), so +1 is a step east and +8 a step south
+NOT_A_FILE = np.uint64(0xFEFEFEFEFEFEFEFE)
+NOT_H_FILE = np.uint64(0x7F7F7F7F7F7F7F7F)
+FULL = np.uint64(0xFFFFFFFFFFFFFFFF)
+LINEAR_SHIFTS = [(1, NOT_A_FILE), (-1, NOT_H_FILE), (8, FULL), (-8, FULL)]
+DIAGONAL_SHIFTS = [(9, NOT_A_FILE), (7, NOT_H_FILE), (-7, NOT_A_FILE), (-9, NOT_H_FILE)]
+KNIGHT_SHIFTS = [
+    (17, NOT_A_FILE), (15, NOT_H_FILE), (-15, NOT_A_FILE), (-17, NOT_H_FILE),
+    (10, np.uint64(0xFCFCFCFCFCFCFCFC)), (6, np.uint64(0x3F3F3F3F3F3F3F3F)),
+    (-6, np.uint64(0xFCFCFCFCFCFCFCFC)), (-10, np.uint64(0x3F3F3F3F3F3F3F3F))
+]
+
+
+def planes_to_bitboards(planes: np.ndarray) -> np.ndarray:
+    "Packs (N, 12, 64) planes back into (N, 12) uint64 bitboards"
+    return np.packbits(planes, axis=-1, bitorder='little').view('<u8').reshape(-1, 12)
+
+
+def _shift(bb: np.ndarray, amount: int, mask: np.uint64) -> np.ndarray:
+    if amount > 0:
+        return (bb << np.uint64(amount)) & mask
+    return (bb >> np.uint64(-amount)) & mask
+
+
+def _slider_attacks(sliders, empty, amount, mask):
+    # Kogge-Stone fill along one direction: spreads the sliders over empty squares in 3 steps
+    empty = empty & mask
+    sliders = sliders | (empty & _shift(sliders, amount, FULL))
+    empty = empty & _shift(empty, amount, FULL)
+    sliders = sliders | (empty & _shift(sliders, 2 * amount, FULL))
+    empty = empty & _shift(empty, 2 * amount, FULL)
+    sliders = sliders | (empty & _shift(sliders, 4 * amount, FULL))
+    return _shift(sliders, amount, mask)
+
+
+def mobility(planes: np.ndarray) -> np.ndarray:
+    "Pseudo-legal move count of knights, bishops, rooks and queens, white minus black"
+    bitboards = planes_to_bitboards(planes)
+    white = np.bitwise_or.reduce(bitboards[:, :6], axis=1)
+    black = np.bitwise_or.reduce(bitboards[:, 6:], axis=1)
+    empty = ~(white | black)
+
+    score = np.zeros(len(planes), dtype=np.int32)
+    for offset, own, sign in ((0, white, 1), (6, black, -1)):
+        not_own = ~own
+        knights, bishops, rooks, queens = (bitboards[:, offset + i] for i in (1, 2, 3, 4))
+        # Within a single direction no two pieces reach the same square, so the counts add up exactly
+        count = np.zeros(len(planes), dtype=np.int32)
+        for amount, mask in KNIGHT_SHIFTS:
+            count += np.bitwise_count(_shift(knights, amount, mask) & not_own)
+        for amount, mask in DIAGONAL_SHIFTS:
+            count += np.bitwise_count(_slider_attacks(bishops | queens, empty, amount, mask) & not_own)
+        for amount, mask in LINEAR_SHIFTS:
+            count += np.bitwise_count(_slider_attacks(rooks | queens, empty, amount, mask) & not_own)
+        score += sign * count
+    return score
+
+
+def pawn_structure(planes: np.ndarray) -> np.ndarray:
+    "Doubled, isolated and passed pawn terms, white minus black"
+    boards = planes.reshape(-1, 12, 8, 8).astype(bool)
+    white, black = boards[:, 0], boards[:, 6]
+
+    def side_score(pawns, enemy):
+        files = pawns.sum(axis=1)
+        doubled = np.maximum(files - 1, 0).sum(axis=1)
+
+        has_pawn = files > 0
+        neighbours = np.zeros_like(has_pawn)
+        neighbours[:, 1:] |= has_pawn[:, :-1]
+        neighbours[:, :-1] |= has_pawn[:, 1:]
+        isolated = (files * ~neighbours).sum(axis=1)
+
+        # Passed: no enemy pawn on the same or adjacent files anywhere in front of the pawn (towards row 0)
+        ahead = np.zeros_like(enemy)
+        ahead[:, 1:] = np.logical_or.accumulate(enemy, axis=1)[:, :-1]
+        blocked = ahead.copy()
+        blocked[:, :, 1:] |= ahead[:, :, :-1]
+        blocked[:, :, :-1] |= ahead[:, :, 1:]
+        passed = pawns & ~blocked
+        passed_score = (passed.sum(axis=2) * PASSED_PAWN_BONUS).sum(axis=1)
+
+        return passed_score - DOUBLED_PAWN_PENALTY * doubled - ISOLATED_PAWN_PENALTY * isolated
+
+    # Black is scored on vertically flipped boards so its pawns also advance towards row 0
+    return side_score(white, black) - side_score(black[:, ::-1], white[:, ::-1])
+
+
+def material_and_placement(planes: np.ndarray) -> np.ndarray:
+    "Material plus piece-square tables, white minus black"
+    return np.einsum('nps,ps->n', planes.astype(np.int32), SQUARE_SCORE_PLANES)
+
+
+def evaluate_terms(planes: np.ndarray) -> dict[str, np.ndarray]:
+    "Every evaluation term of a batch, from white's point of view"
+    return {
+        'material': material_and_placement(planes),
+        'mobility': MOBILITY_WEIGHT * mobility(planes),
+        'pawns': pawn_structure(planes),
+    }
+
+
+def evaluate_batch(planes: np.ndarray, turns: np.ndarray) -> np.ndarray:
+    "Scores of a batch in centipawns, from the point of view of the player to move like evaluation.evaluate"
+    return sum(evaluate_terms(planes).values()) * turns
+
+
+def _random_positions(count: int, seed=0) -> list[str]:
+    # FENs reached by random playouts from the starting position
+    rng = random.Random(seed)
+    fens = []
+    while len(fens) < count:
+        board = Board(quiet=True)
+        for _ in range(rng.randint(10, 80)):
+            moves = board.get_legal_moves()
+            if not moves:
+                break
+            board.make_move(rng.choice(moves))
+            fens.append(board.get_fen_notation())
+    return fens[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure batch evaluation throughput')
+    parser.add_argument('--fens', help='file with one FEN per line, random positions if not given')
+    parser.add_argument('--count', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    if args.fens:
+        with open(args.fens) as f:
+            fens = [line.strip() for line in f if line.strip()][:args.count]
+    else:
+        fens = _random_positions(args.count)
+
+    start = time.perf_counter()
+    planes, turns = encode_fens(fens)
+    encoded = time.perf_counter()
+    scores = evaluate_batch(planes, turns)
+    done = time.perf_counter()
+
+    print(f'Positions: {len(fens)}')
+    print(f'Encode: {encoded - start:.3f}s ({len(fens) / (encoded - start):.0f} positions/s)')
+    print(f'Evaluate: {done - encoded:.3f}s ({len(fens) / (done - encoded):.0f} positions/s)')
+    print(f'Mean score: {scores.mean():.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
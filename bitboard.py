@@ -0,0 +1,223 @@
+# Squares are numbered 0..63 in the same order as Board.board: a8 = 0, h8 = 7, a1 = 56, h1 = 63
+FULL = (1 << 64) - 1
+COLORS = ('WHITE', 'BLACK')
+OPPONENT = {'WHITE': 'BLACK', 'BLACK': 'WHITE'}
+
+KNIGHT_DELTAS = [(1, 2), (2, 1), (-1, 2), (2, -1), (-1, -2), (-2, -1), (-2, 1), (1, -2)]
+KING_DELTAS = [(1, 1), (0, 1), (1, 0), (-1, -1), (0, -1), (-1, 0), (-1, 1), (1, -1)]
+LINEAR_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+DIAGONAL_DIRECTIONS = [(1, 1), (-1, 1), (-1, -1), (1, -1)]
+
+
+def iter_squares(bb: int):
+    "Yields the index of every set bit, lowest first"
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _leaper_table(deltas):
+    # For every square, a bitboard of the squares reachable with one jump
+    table = []
+    for y in range(8):
+        for x in range(8):
+            bb = 0
+            for dx, dy in deltas:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < 8 and 0 <= ny < 8:
+                    bb |= 1 << (ny * 8 + nx)
+            table.append(bb)
+    return table
+
+
+def _ray_table(dx, dy):
+    # For every square, a bitboard of the squares along the ray up to the edge of the board
+    table = []
+    for y in range(8):
+        for x in range(8):
+            bb = 0
+            nx, ny = x + dx, y + dy
+            while 0 <= nx < 8 and 0 <= ny < 8:
+                bb |= 1 << (ny * 8 + nx)
+                nx, ny = nx + dx, ny + dy
+            table.append(bb)
+    return table
+
+
+def _between_table():
+    # For every pair of squares on a shared line, a bitboard of the squares strictly between them
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        x, y = sq % 8, sq // 8
+        for dx, dy in LINEAR_DIRECTIONS + DIAGONAL_DIRECTIONS:
+            between = 0
+            nx, ny = x + dx, y + dy
+            while 0 <= nx < 8 and 0 <= ny < 8:
+                table[sq][ny * 8 + nx] = between
+                between |= 1 << (ny * 8 + nx)
+                nx, ny = nx + dx, ny + dy
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_table(KNIGHT_DELTAS)
+KING_ATTACKS = _leaper_table(KING_DELTAS)
+PAWN_ATTACKS = {
+    'WHITE': _leaper_table([(1, -1), (-1, -1)]),
+    'BLACK': _leaper_table([(1, 1), (-1, 1)])
+}
+
+BETWEEN = _between_table()
+
+# Rays are split by whether they run towards higher square indexes, which decides
+# if the nearest blocker is the lowest or the highest set bit
+RAYS = {d: _ray_table(*d) for d in LINEAR_DIRECTIONS + DIAGONAL_DIRECTIONS}
+_ROOK_RAYS = [(RAYS[d], d[1] * 8 + d[0] > 0) for d in LINEAR_DIRECTIONS]
+_BISHOP_RAYS = [(RAYS[d], d[1] * 8 + d[0] > 0) for d in DIAGONAL_DIRECTIONS]
+
+
+def _slider_attacks(rays, sq: int, occupied: int) -> int:
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            # Cut the ray behind the first blocker, the blocker itself stays attacked
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    return _slider_attacks(_ROOK_RAYS, sq, occupied)
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    return _slider_attacks(_BISHOP_RAYS, sq, occupied)
+
+
+def queen_attacks(sq: int, occupied: int) -> int:
+    return _slider_attacks(_ROOK_RAYS, sq, occupied) | _slider_attacks(_BISHOP_RAYS, sq, occupied)
+
+
+class BitBoard:
+    "Position stored as one 64-bit integer per piece symbol and color"
+    def __init__(self):
+        self.pieces = dict.fromkeys('PNBRQKpnbrqk', 0)
+        self.colors = dict.fromkeys(COLORS, 0)
+        self.occupied = 0
+
+    def add(self, symbol: str, color: str, sq: int):
+        mask = 1 << sq
+        self.pieces[symbol] |= mask
+        self.colors[color] |= mask
+        self.occupied |= mask
+
+    def remove(self, symbol: str, color: str, sq: int):
+        mask = ~(1 << sq)
+        self.pieces[symbol] &= mask
+        self.colors[color] &= mask
+        self.occupied &= mask
+
+    def move(self, symbol: str, color: str, fromsq: int, tosq: int):
+        mask = (1 << fromsq) | (1 << tosq)
+        self.pieces[symbol] ^= mask
+        self.colors[color] ^= mask
+        self.occupied ^= mask
+
+    def attacks(self, symbol: str, color: str, sq: int, occupied: int = None) -> int:
+        "Squares attacked by a piece standing on sq"
+        if occupied is None:
+            occupied = self.occupied
+        kind = symbol.upper()
+        if kind == 'P':
+            return PAWN_ATTACKS[color][sq]
+        if kind == 'N':
+            return KNIGHT_ATTACKS[sq]
+        if kind == 'K':
+            return KING_ATTACKS[sq]
+        if kind == 'B':
+            return bishop_attacks(sq, occupied)
+        if kind == 'R':
+            return rook_attacks(sq, occupied)
+        return queen_attacks(sq, occupied)
+
+    def attackers(self, sq: int, by_color: str, occupied: int = None) -> int:
+        "Pieces of by_color attacking sq, found by looking outward from sq itself"
+        if occupied is None:
+            occupied = self.occupied
+        p = self.pieces
+        if by_color == 'WHITE':
+            pawns, knights, bishops, rooks, queens, king = p['P'], p['N'], p['B'], p['R'], p['Q'], p['K']
+        else:
+            pawns, knights, bishops, rooks, queens, king = p['p'], p['n'], p['b'], p['r'], p['q'], p['k']
+
+        return (
+            (PAWN_ATTACKS[OPPONENT[by_color]][sq] & pawns)
+            | (KNIGHT_ATTACKS[sq] & knights)
+            | (KING_ATTACKS[sq] & king)
+            | (bishop_attacks(sq, occupied) & (bishops | queens))
+            | (rook_attacks(sq, occupied) & (rooks | queens))
+        )
+
+    def is_attacked(self, sq: int, by_color: str, occupied: int = None) -> bool:
+        return bool(self.attackers(sq, by_color, occupied))
+
+    def legal_masks(self, king_sq: int, color: str):
+        "Check evasion mask and pin rays (pinned square -> allowed squares) for the king on king_sq"
+        enemy = OPPONENT[color]
+        checkers = self.attackers(king_sq, enemy)
+        if not checkers:
+            check_mask = FULL
+        elif checkers & (checkers - 1):
+            # Double check, only the king can move
+            check_mask = 0
+        else:
+            # Capture the checker or block the line between it and the king
+            check_mask = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+
+        p = self.pieces
+        if enemy == 'WHITE':
+            bishops, rooks, queens = p['B'], p['R'], p['Q']
+        else:
+            bishops, rooks, queens = p['b'], p['r'], p['q']
+
+        # Sliders that would attack the king if only enemy pieces were on the board
+        enemies = self.colors[enemy]
+        snipers = (
+            (rook_attacks(king_sq, enemies) & (rooks | queens))
+            | (bishop_attacks(king_sq, enemies) & (bishops | queens))
+        )
+        own = self.colors[color]
+        pins = {}
+        for sniper in iter_squares(snipers):
+            between = BETWEEN[king_sq][sniper]
+            blockers = between & self.occupied
+            if blockers & own and not blockers & (blockers - 1):
+                pins[blockers.bit_length() - 1] = between | (1 << sniper)
+        return check_mask, pins
+
+    def targets(self, symbol: str, color: str, sq: int, ep_sq: int = None) -> int:
+        "Pseudo-legal destination squares of a piece (castling excluded)"
+        own, enemy = self.colors[color], self.colors[OPPONENT[color]]
+        if symbol.upper() != 'P':
+            return self.attacks(symbol, color, sq) & ~own
+
+        captures = enemy
+        if ep_sq is not None:
+            captures |= 1 << ep_sq
+        targets = PAWN_ATTACKS[color][sq] & captures
+
+        # Forward movement, double step only from the starting rank
+        step, start_rank = (-8, 6) if color == 'WHITE' else (8, 1)
+        forward = sq + step
+        if 0 <= forward < 64 and not (self.occupied >> forward) & 1:
+            targets |= 1 << forward
+            forward += step
+            if sq // 8 == start_rank and not (self.occupied >> forward) & 1:
+                targets |= 1 << forward
+        return targets
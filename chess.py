@@ -1,14 +1,31 @@
-from constants import Position, STARTING_FEN, FILES
+import re
+import struct
 
+from constants import Position, SQUARES, STARTING_FEN, FILES, MOVE50_LIMIT
+from bitboard import BitBoard, OPPONENT, FULL, iter_squares
+from zobrist import PIECE_KEYS, state_key, compute_hash, castling_rights
+
+
+# Piece, file and rank disambiguation, capture, destination and promotion of a SAN move
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+# From square, to square and optional promotion of a UCI move
+UCI_PATTERN = re.compile(r'^([a-h][1-8])([a-h][1-8])([nbrq])?$')
+
+# 32 byte packed position: occupancy bitboard, a nibble per piece in square order (a8 first),
+# castling rights (low nibble) and en passant file + 1 (high nibble), side to move, halfmove and fullmove clocks
+PACKED_POSITION = struct.Struct('>Q16sBBHI')
+PACKED_SYMBOLS = 'PNBRQKpnbrqk'
+PACKED_CODES = {symbol: code for code, symbol in enumerate(PACKED_SYMBOLS)}
 
-BoardList = list[list['Piece']]
 
 class Piece:
     "Base class for all pieces"
+    __slots__ = ('pos', 'x', 'y', 'sq', 'color', 'symbol')
     piece = ''
     def __init__(self, pos: Position, color: str):
         self.pos = pos
         self.x, self.y = pos.x, pos.y
+        self.sq = pos.y * 8 + pos.x
 
         # color of the piece, will also determine the team it is in
         self.color = color
@@ -20,109 +37,77 @@ class Piece:
         # update the coordinates of piece in square matrix
         self.pos = pos
         self.x, self.y = pos.x, pos.y
-
-    def _check_valid(self, board: BoardList, x, y):
-        # Checks whether the move position is valid (not out of board and not occupied by same team pieces)
-        return 0 <= x < 8 and 0 <= y < 8 and (not board[y][x] or board[y][x].color != self.color)
-
-    def _generate_moves(self, board: BoardList, lst: list[tuple[int, int]]):
-        # Get all valid moves based on incremented directions (diagonal, vertical, horizontal)
-        valid = []
-        for ix, iy in lst:
-            curx, cury = self.pos
-            while True:
-                curx, cury = curx + ix, cury + iy
-                if self._check_valid(board, curx, cury):
-                    valid.append(Position(curx, cury))
-                    if board[cury][curx]:
-                        break
-                else:
-                    break
-        return valid
-
-    def diagonal_moves(self, board):
-        # Get all possible diagonal moves
-        lst = [(1, 1), (-1, 1), (-1, -1), (1, -1)]
-        return self._generate_moves(board, lst)
-        
-    def linear_moves(self, board):
-        # Get all horizontal and vertical moves
-        lst = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-        return self._generate_moves(board, lst)
+        self.sq = pos.y * 8 + pos.x
 
     def __repr__(self):
         return f'[{self.color} {self.piece} {self.x},{self.y}]'
 
 
+# Packed move layout (Move.code): from square in bits 0-5, to square in bits 6-11, promotion piece in bits 12-14
+PROMOTION_CODES = {None: 0, 'N': 1, 'B': 2, 'R': 3, 'Q': 4}
+PROMOTION_PIECES = [None, 'N', 'B', 'R', 'Q']
+# Squares of the first and last rank, where pawns promote
+PROMOTION_RANKS = 0xFF | 0xFF << 56
+
+
 class Move:
-    def __init__(self, piece: Piece, newpos: Position):
+    __slots__ = (
+        'oldpos', 'newpos', 'piece', 'promotion', 'captured', 'promoted', 'rook',
+        'castling', 'ep_square', 'hash', 'move50', 'in_check'
+    )
+
+    def __init__(self, piece: Piece, newpos: Position, promotion: str = None):
         self.oldpos = piece.pos
         self.newpos = newpos
         self.piece = piece
+        # Uppercase symbol of the piece a pawn promotes to, None means queen
+        self.promotion = promotion
+
+        # Undo record, filled in by Board.make_move
+        self.captured: Piece = None
+        self.promoted: Piece = None
+        self.rook: Piece = None
+        self.castling = None
+        self.ep_square: Position = None
+        self.hash = 0
+        self.move50 = 0
+        self.in_check = False
+
+    @property
+    def code(self) -> int:
+        "Squares and promotion packed into an int, identifies the move without keeping objects alive"
+        return self.oldpos.sq | self.newpos.sq << 6 | PROMOTION_CODES[self.promotion] << 12
 
     def to_uci(self):
-        return self.oldpos.symbol() + self.newpos.symbol()
+        suffix = self.promoted.symbol.lower() if self.promoted else (self.promotion or '').lower()
+        return self.oldpos.symbol() + self.newpos.symbol() + suffix
 
 
 class Pawn(Piece):
+    __slots__ = ('increment',)
     piece = 'PAWN'
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.increment = -1 if self.color == 'WHITE' else 1
-    
-    def check_en_passant(self, ep_square):
-        return abs(ep_square[1] - self.x) == 1 and self.y + self.increment == ep_square.y
-
-    def moves(self, board):
-        nposy = self.y + self.increment
-        valid = []
-        
-        if 0 <= nposy <= 7:
-            # Diagonal attack
-            if 0 <= self.x+1 <= 7 and board[nposy][self.x+1] and board[nposy][self.x+1].color != self.color:
-                valid.append(Position(self.x+1, nposy))
-                
-            if 0 <= self.x-1 <= 7 and board[nposy][self.x-1] and board[nposy][self.x-1].color != self.color:
-                valid.append(Position(self.x-1, nposy))
-
-        # Forward Movement
-        if 0 <= nposy <= 7 and board[nposy][self.x] == None:
-            valid.append(Position(self.x, nposy))
-                
-            # Double Forward
-            if (self.color == 'WHITE' and self.y == 6) or (self.color == 'BLACK' and self.y == 1):
-                nposy += self.increment
-                if board[nposy][self.x] == None:
-                    valid.append(Position(self.x, nposy))
-        return valid
 
 
 class Rook(Piece):
+    __slots__ = ()
     piece = 'ROOK'
-    def moves(self, board):
-        return self.linear_moves(board)
 
 
 class Knight(Piece):
+    __slots__ = ()
     piece = 'KNIGHT'
-    def moves(self, board):
-        # Generates max 8 moves based on increment values
-        lst = [(1, 2), (2, 1), (-1, 2), (2, -1), (-1, -2), (-2, -1), (-2, 1), (1, -2)]
-        valid = []
-        for ix, iy in lst:
-            nx, ny = self.x + ix, self.y + iy
-            if self._check_valid(board, nx, ny):
-                valid.append(Position(nx, ny))
-        return valid                    
 
 
 class Bishop(Piece):
+    __slots__ = ()
     piece = 'BISHOP'
-    def moves(self, board):
-        return self.diagonal_moves(board)
 
 
 class King(Piece):
+    __slots__ = ('castling',)
     piece = 'KING'
     def __init__(self, pos, color):
         super().__init__(pos, color)
@@ -137,22 +122,10 @@ class King(Piece):
             valid_moves.append(Position(self.x+2, self.y))
         return valid_moves
 
-    def moves(self, board):
-        # Generates max 8 moves based on increment values (Similar to horse)
-        lst = [(1,1), (0,1), (1,0), (-1,-1), (0,-1), (-1,0), (-1,1), (1,-1)]
-        valid = []
-        for ix, iy in lst:
-            nx, ny = self.x + ix, self.y + iy
-
-            if self._check_valid(board, nx, ny):
-                valid.append(Position(nx, ny))
-        return valid
-
 
 class Queen(Piece):
+    __slots__ = ()
     piece = 'QUEEN'
-    def moves(self, board):
-        return self.diagonal_moves(board) + self.linear_moves(board)
 
 
 PIECE_SYMBOLS = {
@@ -166,11 +139,10 @@ PIECE_SYMBOLS = {
 
 
 class Board:
-    def __init__(self, fen_notation=STARTING_FEN):
+    def __init__(self, fen_notation=STARTING_FEN, quiet=False, move_cache=None, packed: bytes = None):
         # Current player color
         self.turn = 'WHITE'
         self.in_check = False
-        self.in_mate = False
         self.board: list[list[Piece]] = [[None for _ in range(8)] for _ in range(8)]
         
         # Number of moves without capture / pawn movement (Tie)
@@ -180,9 +152,22 @@ class Board:
         # En Passant
         self.ep_square: Position = None
 
-        # Sprite group for all pieces
+        # Sprite group for all pieces, mirrored in bitboards for move generation
         self.pieces = set()
-        self.create_board(fen_notation)
+        self.bitboards = BitBoard()
+
+        # Zobrist hash of the position, updated incrementally as pieces move
+        self.hash = 0
+
+        # Legal moves and mate flag are only generated when asked for, and dropped on every move
+        self._valid_moves = None
+        self._in_mate = None
+        # Optional movecache.MoveCache, possibly shared with other boards, remembering them per position
+        self.move_cache = move_cache
+        if packed is not None:
+            self.unpack(packed)
+        else:
+            self.create_board(fen_notation, quiet)
 
         self.history: list[Move] = []
 
@@ -196,7 +181,7 @@ class Board:
         "Finds a piece with the given conditions"
         return [p for p in self.pieces if ((not piece or p.piece == piece) and (not color or p.color == color))]
 
-    def create_board(self, fen: str):
+    def create_board(self, fen: str, quiet=False):
         "Create the board UI and place chess pieces on the board"
         fields = fen.split()
         ranks = fields[0].split('/')
@@ -211,43 +196,94 @@ class Board:
                     self.add_piece(piece(Position(x, y), color))
                     x += 1
 
+        ep_square = Position.from_symbol(fields[3]) if fields[3] != '-' else None
+        self._set_state(fields[1] == 'w', fields[2], ep_square, int(fields[4]), int(fields[5]))
+        if not quiet:
+            self.print_board()
+
+    def _set_state(self, white_to_move: bool, castling: str, ep_square: Position, move50: int, fullmoves: int):
         # Store kings for both players, useful for checks and castling
         self.kings = {
-            'WHITE': self.find_piece('KING', 'WHITE')[0], 
+            'WHITE': self.find_piece('KING', 'WHITE')[0],
             'BLACK': self.find_piece('KING', 'BLACK')[0]
         }
 
-        self.turn = 'WHITE' if fields[1] == 'w' else 'BLACK'
-        self.set_fen_castling(fields[2])
-        self.ep_square = Position.from_symbol(fields[3]) if fields[3] != '-' else None
-        self.move50 = int(fields[4])
-        self.fullmoves = int(fields[5])
-        self.all_valid_moves = self.get_all_moves()
-        self.print_board()
+        self.turn = 'WHITE' if white_to_move else 'BLACK'
+        self.set_fen_castling(castling)
+        self.ep_square = ep_square
+        self.move50 = move50
+        self.fullmoves = fullmoves
+        self.hash = compute_hash(self)
+        self.in_check = self.is_check()
+
+    def to_bytes(self) -> bytes:
+        "The position packed into PACKED_POSITION's 32 bytes, read back with Board.from_bytes"
+        occupied = self.bitboards.occupied
+        nibbles = bytearray(16)
+        board = self.board
+        for i, sq in enumerate(iter_squares(occupied)):
+            if i == 32:
+                raise ValueError('Can not pack a position with more than 32 pieces')
+            nibbles[i >> 1] |= PACKED_CODES[board[sq >> 3][sq & 7].symbol] << (0 if i & 1 else 4)
+        ep = self.ep_square.x + 1 if self.ep_square else 0
+        return PACKED_POSITION.pack(
+            occupied, bytes(nibbles), castling_rights(self) | ep << 4, self.turn == 'BLACK', self.move50, self.fullmoves
+        )
+
+    @classmethod
+    def from_bytes(cls, data, move_cache=None) -> 'Board':
+        "Board of a position packed with to_bytes, data can be any buffer (bytes, memoryview, mmap) of 32 bytes"
+        return cls(quiet=True, move_cache=move_cache, packed=data)
+
+    def unpack(self, data):
+        occupied, nibbles, flags, black, move50, fullmoves = PACKED_POSITION.unpack_from(data)
+        for i, sq in enumerate(iter_squares(occupied)):
+            symbol = PACKED_SYMBOLS[nibbles[i >> 1] >> (0 if i & 1 else 4) & 15]
+            piece = PIECE_SYMBOLS[symbol.upper()]
+            self.add_piece(piece(SQUARES[sq], 'WHITE' if symbol.isupper() else 'BLACK'))
+
+        castling = ''.join(right for i, right in enumerate('KQkq') if flags >> i & 1)
+        ep_file = flags >> 4
+        ep_square = Position(ep_file - 1, 5 if black else 2) if ep_file else None
+        self._set_state(not black, castling, ep_square, move50, fullmoves)
     
     def set_fen_castling(self, fen):
-        white_king, black_king = self.kings['WHITE'], self.kings['BLACK']
-        if 'Q' in fen:
-            white_king.castling[0] = self.get_piece(Position(0, 7))
-        if 'K' in fen:
-            white_king.castling[1] = self.get_piece(Position(7, 7))
-        if 'q' in fen:
-            black_king.castling[0] = self.get_piece(Position(0, 0))
-        if 'k' in fen:
-            black_king.castling[1] = self.get_piece(Position(7, 0))
+        "Gives the kings the castling rights of a FEN, raises ValueError unless the king and the rook are on their squares"
+        for right, color, y, side in (('Q', 'WHITE', 7, 0), ('K', 'WHITE', 7, 1), ('q', 'BLACK', 0, 0), ('k', 'BLACK', 0, 1)):
+            if right not in fen:
+                continue
+            king = self.kings[color]
+            rook = self.get_piece(Position(7 * side, y))
+            if king.pos != Position(4, y) or not isinstance(rook, Rook) or rook.color != color:
+                raise ValueError(f'Invalid castling right {right}')
+            king.castling[side] = rook
+
+    def is_repetition(self, count=3):
+        "Whether the current position has occurred count times, only positions since the last capture or pawn move can repeat"
+        seen = 1
+        for move in reversed(self.history[max(0, len(self.history) - self.move50):]):
+            if move.hash == self.hash:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
 
     def get_fen_notation(self):
-        board_fen = ''
+        ranks = []
         for i in range(8):
+            rank_fen = ''
             empty = 0
             for j in range(8):
                 if self.board[i][j]:
-                    board_fen += str(empty) if empty else ""
-                    board_fen += self.board[i][j].symbol
+                    rank_fen += str(empty) if empty else ""
+                    rank_fen += self.board[i][j].symbol
+                    empty = 0
                 else:
                     empty += 1
-            board_fen += "/"
-        
+            rank_fen += str(empty) if empty else ""
+            ranks.append(rank_fen)
+        board_fen = '/'.join(ranks)
+
         turn_fen = 'w' if self.turn == 'WHITE' else 'b'
         castling_fen = self.get_fen_castling()
         ep_fen = self.ep_square.symbol() if self.ep_square else '-'
@@ -271,62 +307,235 @@ class Board:
 
     def get_move_notation(
         self, piece, oldpos, newpos, captured=False, castling=False,
-        promotion=None
+        promotion=None, disambiguation=''
     ):
-        "Incomplete algebraic move notation"
-        if castling:
-            return 'O-O' if oldpos.x < newpos.x else 'O-O-O'
-
-        destination = newpos.symbol()
-        if piece.piece == 'PAWN':
-            piece_symbol = FILES[oldpos.x]
-            if not captured:
-                return destination
-        else:
-            piece_symbol = piece.symbol.upper()
-
-        capture = "x" if captured else ""
-        promotion_suffix = f"={promotion.symbol.upper()}" if promotion else ""
+        "Standard algebraic notation of the move that was just played"
         check_suffix = ""
         if self.in_check and self.in_mate:
             check_suffix = "#"
         elif self.in_check:
             check_suffix = "+"
 
-        return f"{piece_symbol}{capture}{destination}{check_suffix}{promotion_suffix}"
+        if castling:
+            return ('O-O' if oldpos.x < newpos.x else 'O-O-O') + check_suffix
 
-    def copy_board(self):
-        "Returs a copy of the 2d board"
-        return [[c for c in r] for r in self.board]
+        destination = newpos.symbol()
+        if piece.piece == 'PAWN':
+            piece_symbol = FILES[oldpos.x] if captured else ""
+        else:
+            piece_symbol = piece.symbol.upper() + disambiguation
 
-    def get_all_moves(self):
+        capture = "x" if captured else ""
+        promotion_suffix = f"={promotion.symbol.upper()}" if promotion else ""
+        return f"{piece_symbol}{capture}{destination}{promotion_suffix}{check_suffix}"
+
+    def get_disambiguation(self, piece, newpos) -> str:
+        "File, rank or square needed in SAN to tell the piece apart from others of its kind reaching newpos"
+        if piece.piece in ('PAWN', 'KING'):
+            return ''
+
+        others = []
+        for other in self.pieces:
+            if other is piece or other.symbol != piece.symbol:
+                continue
+            # Cheap attack test first, legality only for the pieces that pass it
+            if self.bitboards.attacks(other.symbol, other.color, other.sq) >> newpos.sq & 1:
+                if newpos in self.get_piece_moves(other):
+                    others.append(other)
+
+        if not others:
+            return ''
+        if all(other.x != piece.x for other in others):
+            return FILES[piece.x]
+        if all(other.y != piece.y for other in others):
+            return str(8 - piece.y)
+        return piece.pos.symbol()
+
+    def get_san(self, move: Move) -> str:
+        "Standard algebraic notation of a legal move of this position, without playing it"
+        key = self.hash
+        if self.move_cache:
+            notation = self.move_cache.get_san(key, move.code)
+            if notation:
+                return notation
+
+        valid_moves, in_mate = self._valid_moves, self._in_mate
+        disambiguation = self.get_disambiguation(move.piece, move.newpos)
+        self.make_move(move)
+        notation = self.get_move_notation(
+            move.piece, move.oldpos, move.newpos, captured=move.captured,
+            castling=bool(move.rook), promotion=move.promoted, disambiguation=disambiguation
+        )
+        self.unmake_move()
+        self._valid_moves, self._in_mate = valid_moves, in_mate
+        if self.move_cache:
+            self.move_cache.store_san(key, move.code, notation)
+        return notation
+
+    def parse_san(self, san: str) -> Move:
+        "Finds the legal move written in standard algebraic notation, raises ValueError if there is none"
+        text = san.rstrip('+#!?')
+        if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            king = self.get_current_king()
+            newpos = king.pos.move(2 if len(text) == 3 else -2, 0)
+            if newpos not in self.all_valid_moves.get(king.pos, []):
+                raise ValueError(f'Illegal SAN move: {san}')
+            return Move(king, newpos)
+
+        match = SAN_PATTERN.match(text)
+        if not match:
+            raise ValueError(f'Invalid SAN move: {san}')
+        kind, file, rank, target, promotion = match.groups()
+        piece_name = PIECE_SYMBOLS[kind or 'P'].piece
+        newpos = Position.from_symbol(target)
+
+        candidates = []
+        for pos, targets in self.all_valid_moves.items():
+            if newpos not in targets or self.board[pos.y][pos.x].piece != piece_name:
+                continue
+            if (file and FILES[pos.x] != file) or (rank and str(8 - pos.y) != rank):
+                continue
+            candidates.append(pos)
+
+        if len(candidates) != 1:
+            raise ValueError(f'{"Ambiguous" if candidates else "Illegal"} SAN move: {san}')
+        piece = self.get_piece(candidates[0])
+        if promotion and not (piece.piece == 'PAWN' and newpos.y in (0, 7)):
+            raise ValueError(f'Invalid promotion: {san}')
+        return Move(piece, newpos, promotion)
+
+    def from_uci(self, uci: str) -> Move:
+        "Finds the legal move written in UCI notation (e2e4, e7e8q), raises ValueError if there is none"
+        match = UCI_PATTERN.match(uci)
+        if not match:
+            raise ValueError(f'Invalid UCI move: {uci}')
+        oldpos, newpos = Position.from_symbol(match.group(1)), Position.from_symbol(match.group(2))
+        promotion = match.group(3) and match.group(3).upper()
+
+        piece = self.get_piece(oldpos)
+        if not piece or piece.color != self.turn:
+            raise ValueError(f'Illegal UCI move: {uci}')
+        # Only the moving piece is generated, unless the moves of the whole position are at hand anyway
+        if self._valid_moves is not None or self.move_cache:
+            targets = self.all_valid_moves.get(oldpos, [])
+        else:
+            targets = self.get_piece_moves(piece)
+        if newpos not in targets:
+            raise ValueError(f'Illegal UCI move: {uci}')
+        if promotion and not (piece.piece == 'PAWN' and newpos.y in (0, 7)):
+            raise ValueError(f'Invalid promotion: {uci}')
+        return Move(piece, newpos, promotion)
+
+    def push_uci(self, uci: str) -> Move:
+        "Plays a move written in UCI notation without generating its SAN, raises ValueError if it is not legal"
+        move = self.from_uci(uci)
+        self.make_move(move)
+        return move
+
+    def get_all_moves(self, only=FULL):
+        # Pins and check evasions are computed once for the whole position
+        masks = self.bitboards.legal_masks(self.kings[self.turn].sq, self.turn)
         pieces = [p for p in self.pieces if p.color == self.turn]
         moves = {}
         for p in pieces:
-           moves[p.pos] = self.get_piece_moves(p)
+           moves[p.pos] = self.get_piece_moves(p, masks, only)
         return moves
 
-    def get_piece_moves(self, piece):
-        moves = piece.moves(self.board)
-        # Check if castling is possible
-        is_king = piece.piece == 'KING'
-        if is_king and not self.in_check:
-            moves += piece.check_castling(self.board)
-        elif piece.piece == 'PAWN' and self.ep_square and piece.check_en_passant(self.ep_square):
-            moves += [self.ep_square]
-        
-        # validate every move
-        valid_moves = []
-        for move in moves:
-            boardcpy = self.copy_board()
-            boardcpy[piece.y][piece.x] = None
-            boardcpy[move.y][move.x] = piece
-            if not self.is_check(boardcpy, pos=move, is_king=is_king):
-                valid_moves.append(move)
-        return valid_moves
+    @property
+    def all_valid_moves(self) -> dict[Position, list[Position]]:
+        "Legal moves of every piece of the player to move, generated on first use after a move"
+        if self._valid_moves is None:
+            self._valid_moves = self.move_cache.moves(self) if self.move_cache else self.get_all_moves()
+        return self._valid_moves
+
+    @property
+    def in_mate(self) -> bool:
+        "True when the player to move has no legal move (checkmate or stalemate)"
+        if self._in_mate is None:
+            if self._valid_moves is not None:
+                self._in_mate = not any(self._valid_moves.values())
+            elif self.move_cache:
+                self._in_mate = self.move_cache.in_mate(self)
+            else:
+                self._in_mate = next(self.iter_legal_moves(), None) is None
+        return self._in_mate
+
+    def iter_legal_moves(self, captures_only=False):
+        """
+        Yields the legal moves of the player to move one piece at a time, so callers can stop early.
+        captures_only keeps captures (en passant included) and promotions, the moves a quiescence search needs.
+        """
+        only = pawn_only = FULL
+        if captures_only:
+            only = self.bitboards.colors[OPPONENT[self.turn]]
+            if self.ep_square:
+                only |= 1 << self.ep_square.sq
+            # A push to the last rank changes the material as much as a capture
+            pawn_only = only | PROMOTION_RANKS
+
+        masks = self.bitboards.legal_masks(self.kings[self.turn].sq, self.turn)
+        for piece in [p for p in self.pieces if p.color == self.turn]:
+            for newpos in self.get_piece_moves(piece, masks, pawn_only if piece.piece == 'PAWN' else only):
+                if piece.piece == 'PAWN' and newpos.y in (0, 7):
+                    for promotion in 'QRBN':
+                        yield Move(piece, newpos, promotion)
+                else:
+                    yield Move(piece, newpos)
+
+    def get_legal_moves(self, captures_only=False) -> list[Move]:
+        "All legal moves of the player to move as Move objects, with one move per promotion piece"
+        return list(self.iter_legal_moves(captures_only))
+
+    def decode_move(self, code: int) -> Move:
+        "Move object of a packed move (Move.code) in this position"
+        piece = self.get_piece(SQUARES[code & 63])
+        return Move(piece, SQUARES[code >> 6 & 63], PROMOTION_PIECES[code >> 12 & 7])
+
+    def get_piece_moves(self, piece, masks=None, only=FULL):
+        "Legal destinations of a piece, restricted to the squares in the only bitboard"
+        bitboards = self.bitboards
+        enemy = OPPONENT[piece.color]
+        fromsq = piece.sq
+        ep_sq = self.ep_square.sq if self.ep_square else None
+        targets = bitboards.targets(piece.symbol, piece.color, fromsq, ep_sq) & only
+
+        if piece.piece == 'KING':
+            # The king may not step onto an attacked square, including ones it shields itself
+            occupied = bitboards.occupied & ~(1 << fromsq)
+            moves = [SQUARES[sq] for sq in iter_squares(targets) if not bitboards.is_attacked(sq, enemy, occupied)]
+
+            # Check if castling is possible, the king may not pass through an attacked square
+            if only == FULL and not bitboards.is_attacked(fromsq, enemy):
+                for castle in piece.check_castling(self.board):
+                    passing = (fromsq + castle.sq) // 2
+                    if not bitboards.is_attacked(passing, enemy) and not bitboards.is_attacked(castle.sq, enemy):
+                        moves.append(castle)
+            return moves
+
+        kingsq = self.kings[piece.color].sq
+        check_mask, pins = masks or bitboards.legal_masks(kingsq, piece.color)
+        allowed = check_mask & pins.get(fromsq, FULL)
+
+        if ep_sq is None or piece.piece != 'PAWN' or not targets >> ep_sq & 1:
+            return [SQUARES[sq] for sq in iter_squares(targets & allowed)]
+
+        # En passant removes two pieces from a line at once, so replay it on the occupancy bitboard
+        moves = [SQUARES[sq] for sq in iter_squares(targets & allowed & ~(1 << ep_sq))]
+        captured = 1 << (ep_sq - 8 * piece.increment)
+        occupied = (bitboards.occupied & ~(1 << fromsq) & ~captured) | (1 << ep_sq)
+        if not bitboards.attackers(kingsq, enemy, occupied) & ~captured:
+            moves.append(self.ep_square)
+        return moves
+
+    def is_square_attacked(self, pos: Position, by_color: str) -> bool:
+        "Whether any piece of by_color attacks the given square"
+        return self.bitboards.is_attacked(pos.sq, by_color)
 
     def _move_piece(self, piece: Piece, newpos: Position):
         self.board[piece.y][piece.x] = None
+        fromsq, tosq = piece.sq, newpos.sq
+        self.bitboards.move(piece.symbol, piece.color, fromsq, tosq)
+        self.hash ^= PIECE_KEYS[piece.symbol][fromsq] ^ PIECE_KEYS[piece.symbol][tosq]
         piece.move(newpos)
         self.board[newpos.y][newpos.x] = piece
 
@@ -334,85 +543,153 @@ class Board:
         "Add the sprite to sprite groups"
         self.board[piece.pos.y][piece.pos.x] = piece
         self.pieces.add(piece)
+        self.bitboards.add(piece.symbol, piece.color, piece.sq)
+        self.hash ^= PIECE_KEYS[piece.symbol][piece.sq]
 
     def remove_piece(self, piece: Piece):
         "Kills the piece and removes it from the board"
         self.pieces.remove(piece)
         self.board[piece.y][piece.x] = None
+        self.bitboards.remove(piece.symbol, piece.color, piece.sq)
+        self.hash ^= PIECE_KEYS[piece.symbol][piece.sq]
+
+    def make_move(self, move: Move):
+        "Apply a move in place, keeping everything needed to take it back in the move itself"
+        piece, oldpos, newpos = move.piece, move.oldpos, move.newpos
+        white_king, black_king = self.kings['WHITE'], self.kings['BLACK']
+        move.castling = (*white_king.castling, *black_king.castling)
+        move.ep_square = self.ep_square
+        move.move50 = self.move50
+        move.in_check = self.in_check
+        move.hash = self.hash
+        # Take out castling rights, en passant and turn, they are hashed back in once the move is done
+        self.hash ^= state_key(self)
 
-    def move_piece(self, piece: Piece, newpos: Position):
-        "Move a chess piece in the board"
         # Get the original piece on the board
         capture_piece = self.board[newpos.y][newpos.x]
-        if isinstance(piece, Pawn) and newpos == self.ep_square:
+        if piece.piece == 'PAWN' and newpos == self.ep_square:
             capture_piece = self.board[newpos.y - piece.increment][newpos.x]
 
-        if isinstance(piece, Pawn) or capture_piece:
+        if piece.piece == 'PAWN' or capture_piece:
             self.move50 = 0
             if capture_piece:
                 self.remove_piece(capture_piece)
+                # A captured rook takes its castling right with it
+                enemy_king = self.kings[capture_piece.color]
+                if capture_piece in enemy_king.castling:
+                    enemy_king.castling[enemy_king.castling.index(capture_piece)] = None
         else:
             self.move50 += 1
+        move.captured = capture_piece
 
-        # Store original positions for future reference
-        self.history.append(Move(piece, newpos))
         self.ep_square = None
         king = self.get_current_king()
-        oldpos = piece.pos
-        castling = False
-        promotion = None
         if piece.piece == 'KING':
             piece.castling = [None, None]
             if abs(newpos.x - oldpos.x) == 2:
-                castling = True
                 rook = self.board[piece.y][7 if (newpos.x - oldpos.x) > 0 else 0]
                 diff = 1 if rook.x == 0 else -1
+                move.rook = rook
                 self._move_piece(rook, newpos.move(diff, 0))
         elif piece.piece == 'ROOK' and piece in king.castling:
             side = king.castling.index(piece)
             king.castling[side] = None
-        elif piece.piece == 'PAWN':
-            # Moved 2 spaces, check en 
-            if abs(newpos.y - oldpos.y) == 2:
-                self.ep_square = Position(newpos.x, newpos.y - piece.increment)
-
-            # Pawn Promotion...
-            if newpos.y in (0, 7):
-                # Just gonna promote it to queen cuz... why not
-                # First kill the original pawn
-                self.remove_piece(piece)
-                # Create the queen and add it to sprite groups and board
-                promotion = Queen(newpos, self.turn)
-                self.add_piece(promotion)
-        
+        elif piece.piece == 'PAWN' and abs(newpos.y - oldpos.y) == 2:
+            # Moved 2 spaces, check en passant
+            self.ep_square = Position(newpos.x, newpos.y - piece.increment)
+
         # Change coordinates of the moving piece
         self._move_piece(piece, newpos)
+
+        # Pawn Promotion, replace the pawn with the new piece
+        if piece.piece == 'PAWN' and newpos.y in (0, 7):
+            self.remove_piece(piece)
+            # A move that is played again keeps its promoted piece, later moves in the history refer to it
+            if not move.promoted:
+                move.promoted = PIECE_SYMBOLS[move.promotion or 'Q'](newpos, self.turn)
+            self.add_piece(move.promoted)
+
         if self.turn == 'BLACK':
             self.fullmoves += 1
 
         self.turn = 'BLACK' if self.turn == 'WHITE' else 'WHITE'
-        self.in_check = self.is_check(self.board)
-        self.all_valid_moves = self.get_all_moves()
-        self.in_mate = not any(self.all_valid_moves.values())
-        return self.get_move_notation(
-            piece, oldpos, newpos, captured=capture_piece, 
-            castling=castling, promotion=promotion
-        )
+        self.hash ^= state_key(self)
+        self.in_check = self.is_check()
+        self._valid_moves = self._in_mate = None
+        self.history.append(move)
+
+    def unmake_move(self) -> Move:
+        "Take back the last move applied with make_move and restore the position exactly"
+        move = self.history.pop()
+        piece = move.piece
+        self.turn = 'BLACK' if self.turn == 'WHITE' else 'WHITE'
+        if self.turn == 'BLACK':
+            self.fullmoves -= 1
 
-    def is_check(self, board, pos=None, is_king=False):
-        "Look for a check, return True if it is a checkmate"
-        # Get all enemy pieces that do not occupy x,y (place we are going to put our piece)
-        enemies = [e for e in self.pieces if e.color != self.turn and e.pos != pos]
-        king = self.kings[self.turn]
-
-        for e in enemies:
-            # Loop through all enemy moves and see if the king's position lies in it
-            moves = e.moves(board)
-            if not is_king and king.pos in moves:
-                return True
-            if is_king and pos in moves:
-                return True
-        return False
+        if move.promoted:
+            self.remove_piece(move.promoted)
+            self.add_piece(piece)
+        self._move_piece(piece, move.oldpos)
+
+        if move.rook:
+            rook = move.rook
+            self._move_piece(rook, Position(7 if move.newpos.x > move.oldpos.x else 0, rook.y))
+        if move.captured:
+            self.add_piece(move.captured)
+
+        white_king, black_king = self.kings['WHITE'], self.kings['BLACK']
+        white_king.castling = list(move.castling[:2])
+        black_king.castling = list(move.castling[2:])
+        self.ep_square = move.ep_square
+        self.move50 = move.move50
+        self.in_check = move.in_check
+        self._valid_moves = self._in_mate = None
+        self.hash = move.hash
+        return move
+
+    def move_piece(self, piece: Piece, newpos: Position, promotion: str = None):
+        "Move a chess piece in the board, promotion is the symbol of the piece a pawn becomes (queen by default)"
+        move = Move(piece, newpos, promotion)
+        key = self.hash
+        if self.move_cache:
+            notation = self.move_cache.get_san(key, move.code)
+            if notation:
+                self.make_move(move)
+                return notation
+
+        disambiguation = self.get_disambiguation(piece, newpos)
+        self.make_move(move)
+        notation = self.get_move_notation(
+            piece, move.oldpos, newpos, captured=move.captured,
+            castling=bool(move.rook), promotion=move.promoted, disambiguation=disambiguation
+        )
+        if self.move_cache:
+            self.move_cache.store_san(key, move.code, notation)
+        return notation
+
+    def undo_move(self):
+        "Take back the last move played, returns the move or None if there is nothing to undo"
+        if not self.history:
+            return None
+        return self.unmake_move()
+
+    def probe_tablebase(self, tablebases):
+        "Exact (wdl, moves to mate) of the position from a tablebase.Tablebases, None if it has no table for it or is illegal"
+        return tablebases.probe(self)
+
+    def status(self) -> str:
+        "ongoing, check, checkmate, stalemate or move50, decided the same way as ui.Game.handle_event"
+        if self.in_mate:
+            return 'checkmate' if self.in_check else 'stalemate'
+        if self.move50 >= MOVE50_LIMIT:
+            return 'move50'
+        return 'check' if self.in_check else 'ongoing'
+
+    def is_check(self, color=None):
+        "Look for a check on the king of the given color (defaults to the player to move)"
+        color = color or self.turn
+        king = self.kings[color]
+        return self.is_square_attacked(king.pos, OPPONENT[color])
     
     def print_board(self):
         string = '  +-----------------+\n'
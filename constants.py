@@ -3,9 +3,18 @@ import collections
 # Game Configurations
 STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 FILES = 'abcdefgh'
+# Halfmove clock (FEN half moves without a capture or pawn movement) at which the game is a tie, 50 moves each
+MOVE50_LIMIT = 100
 
 
 class Position(collections.namedtuple('Position', ['x', 'y'])):
+    # Squares are plain 0..63 ints internally (a8 = 0, h1 = 63), Position stays the public coordinate type
+    __slots__ = ()
+
+    @property
+    def sq(self):
+        return self.y * 8 + self.x
+
     def move(self, dx, dy):
         return Position(self.x + dx, self.y + dy)
     
@@ -15,5 +24,8 @@ class Position(collections.namedtuple('Position', ['x', 'y'])):
     @classmethod
     def from_symbol(cls, symbol):
         x = 'abcdefgh'.index(symbol[0])
-        y = int(symbol[1]) - 1
-        return cls(x, y)
+        y = 8 - int(symbol[1])
+        return SQUARES[y * 8 + x]
+
+
+SQUARES = [Position(x, y) for y in range(8) for x in range(8)]
@@ -0,0 +1,102 @@
+from bitboard import iter_squares
+
+
+PIECE_VALUES = {
+    'PAWN': 100,
+    'KNIGHT': 320,
+    'BISHOP': 330,
+    'ROOK': 500,
+    'QUEEN': 900,
+    'KING': 0
+}
+
+# Piece-square tables from white's point of view, listed from a8 to h1 like Board.board
+# Credits: https://www.chessprogramming.org/Simplified_Evaluation_Function
+PIECE_SQUARE_TABLES = {
+    'PAWN': [
+         0,  0,  0,  0,  0,  0,  0,  0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+         5,  5, 10, 25, 25, 10,  5,  5,
+         0,  0,  0, 20, 20,  0,  0,  0,
+         5, -5,-10,  0,  0,-10, -5,  5,
+         5, 10, 10,-20,-20, 10, 10,  5,
+         0,  0,  0,  0,  0,  0,  0,  0
+    ],
+    'KNIGHT': [
+        -50,-40,-30,-30,-30,-30,-40,-50,
+        -40,-20,  0,  0,  0,  0,-20,-40,
+        -30,  0, 10, 15, 15, 10,  0,-30,
+        -30,  5, 15, 20, 20, 15,  5,-30,
+        -30,  0, 15, 20, 20, 15,  0,-30,
+        -30,  5, 10, 15, 15, 10,  5,-30,
+        -40,-20,  0,  5,  5,  0,-20,-40,
+        -50,-40,-30,-30,-30,-30,-40,-50
+    ],
+    'BISHOP': [
+        -20,-10,-10,-10,-10,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5, 10, 10,  5,  0,-10,
+        -10,  5,  5, 10, 10,  5,  5,-10,
+        -10,  0, 10, 10, 10, 10,  0,-10,
+        -10, 10, 10, 10, 10, 10, 10,-10,
+        -10,  5,  0,  0,  0,  0,  5,-10,
+        -20,-10,-10,-10,-10,-10,-10,-20
+    ],
+    'ROOK': [
+          0,  0,  0,  0,  0,  0,  0,  0,
+          5, 10, 10, 10, 10, 10, 10,  5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+          0,  0,  0,  5,  5,  0,  0,  0
+    ],
+    'QUEEN': [
+        -20,-10,-10, -5, -5,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5,  5,  5,  5,  0,-10,
+         -5,  0,  5,  5,  5,  5,  0, -5,
+          0,  0,  5,  5,  5,  5,  0, -5,
+        -10,  5,  5,  5,  5,  5,  0,-10,
+        -10,  0,  5,  0,  0,  0,  0,-10,
+        -20,-10,-10, -5, -5,-10,-10,-20
+    ],
+    'KING': [
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -20,-30,-30,-40,-40,-30,-30,-20,
+        -10,-20,-20,-20,-20,-20,-20,-10,
+         20, 20,  0,  0,  0,  0, 20, 20,
+         20, 30, 10,  0,  0, 10, 30, 20
+    ]
+}
+
+SYMBOL_PIECES = {'P': 'PAWN', 'N': 'KNIGHT', 'B': 'BISHOP', 'R': 'ROOK', 'Q': 'QUEEN', 'K': 'KING'}
+
+
+def _square_scores():
+    # Material plus placement for every piece symbol and square, positive for white and negative for black
+    # Black uses the white table mirrored vertically (square ^ 56 flips the rank)
+    scores = {}
+    for symbol, piece in SYMBOL_PIECES.items():
+        value, table = PIECE_VALUES[piece], PIECE_SQUARE_TABLES[piece]
+        scores[symbol] = [value + table[sq] for sq in range(64)]
+        scores[symbol.lower()] = [-(value + table[sq ^ 56]) for sq in range(64)]
+    return scores
+
+
+SQUARE_SCORES = _square_scores()
+
+
+def evaluate(board) -> int:
+    "Static evaluation in centipawns from the point of view of the player to move"
+    score = 0
+    for symbol, bb in board.bitboards.pieces.items():
+        table = SQUARE_SCORES[symbol]
+        for sq in iter_squares(bb):
+            score += table[sq]
+    return score if board.turn == 'WHITE' else -score
@@ -0,0 +1,174 @@
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from chess import Board
+
+
+# Board methods that are counted and timed while instrumentation is enabled
+INSTRUMENTED = (
+    'move_piece', 'make_move', 'unmake_move', 'get_all_moves', 'get_legal_moves', 'get_piece_moves',
+    'is_check', 'is_square_attacked', 'get_san', 'parse_san', 'from_uci',
+)
+# Seconds between two stack samples of the collapsed stack profiler
+SAMPLE_INTERVAL = 0.001
+
+
+class Stats:
+    "Call counts, cumulative (inclusive) seconds, generated and made moves of the instrumented methods"
+    def __init__(self):
+        self.calls = Counter()
+        self.seconds = defaultdict(float)
+        # Destinations returned by get_piece_moves, the moves the generator produced
+        self.nodes = 0
+        # Moves played on a board by make_move, the search and replays go through it
+        self.made = 0
+
+    def reset(self):
+        self.__init__()
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': dict(self.calls), 'seconds': dict(self.seconds),
+            'nodes': self.nodes, 'made': self.made,
+        }
+
+    def report(self) -> str:
+        lines = [f'{"method":<20} {"calls":>10} {"total ms":>10} {"us/call":>8}']
+        for name, calls in self.calls.most_common():
+            seconds = self.seconds[name]
+            lines.append(f'{name:<20} {calls:>10} {seconds * 1000:>10.1f} {seconds / calls * 1e6:>8.2f}')
+        lines.append(f'Moves generated: {self.nodes}  moves made: {self.made}')
+        return '\n'.join(lines)
+
+
+stats = Stats()
+_originals = {}
+
+
+def _instrument(name: str, method):
+    perf_counter = time.perf_counter
+    calls, seconds = stats.calls, stats.seconds
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            calls[name] += 1
+            seconds[name] += perf_counter() - start
+
+    if name == 'get_piece_moves':
+        def wrapper(*args, _timed=wrapper, **kwargs):
+            moves = _timed(*args, **kwargs)
+            stats.nodes += len(moves)
+            return moves
+    elif name == 'make_move':
+        def wrapper(*args, _timed=wrapper, **kwargs):
+            stats.made += 1
+            return _timed(*args, **kwargs)
+
+    wrapper.__wrapped__ = method
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def enable():
+    """
+    Swaps counting and timing wrappers in for the instrumented Board methods.
+    While disabled the original methods are in place, so there is no cost at all.
+    """
+    if _originals:
+        return
+    stats.reset()
+    for name in INSTRUMENTED:
+        _originals[name] = Board.__dict__[name]
+        setattr(Board, name, _instrument(name, _originals[name]))
+
+
+def disable():
+    for name, method in _originals.items():
+        setattr(Board, name, method)
+    _originals.clear()
+
+
+def enabled() -> bool:
+    return bool(_originals)
+
+
+class StackSampler:
+    "Samples the stack of one thread at a fixed interval and counts collapsed stacks (flamegraph.pl / speedscope input)"
+    def __init__(self, thread_id: int = None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._switch_interval = sys.getswitchinterval()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        # The sampler only runs when the profiled thread releases the GIL, by default every 5ms
+        sys.setswitchinterval(self.interval)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def add_arguments(parser):
+    "The --profile and --stats switches shared by the command line entry points"
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help='profile the run: FILE.folded writes sampled collapsed stacks for flamegraphs, any other name cProfile data'
+    )
+    parser.add_argument('--stats', action='store_true', help='count and time the board methods, printed on exit')
+
+
+@contextmanager
+def profiling(path: str = None, with_stats=False, out=sys.stderr):
+    "Profiles and/or instruments the body according to the --profile and --stats switches"
+    if with_stats:
+        enable()
+    profiler = sampler = None
+    if path and path.endswith('.folded'):
+        sampler = StackSampler()
+        sampler.start()
+    elif path:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield stats
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(path)
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(15)
+        if sampler:
+            sampler.stop()
+            sampler.write(path)
+            print(f'{sum(sampler.samples.values())} stack samples written to {path}', file=out)
+        if with_stats:
+            disable()
+            print(stats.report(), file=out)
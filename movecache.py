@@ -0,0 +1,79 @@
+from collections import OrderedDict
+
+
+class CacheEntry:
+    "What is remembered of one position: legal moves per square, the mate flag and the SAN of moves played from it"
+    __slots__ = ('moves', 'in_mate', 'san')
+
+    def __init__(self):
+        self.moves = None
+        self.in_mate = None
+        self.san = {}
+
+
+class MoveCache:
+    """
+    Bounded LRU cache of legal moves, mate flags and move notation keyed by the board's zobrist hash.
+    One cache can be shared by every Board of a process, the cached move lists are shared too and must not be modified.
+    """
+    def __init__(self, size=1 << 16):
+        self.size = max(size, 1)
+        self.entries: OrderedDict[int, CacheEntry] = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def entry(self, key: int) -> CacheEntry:
+        "Entry of a position, marked as most recently used, a new one is added when the position is not cached"
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+
+        entry = self.entries[key] = CacheEntry()
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def moves(self, board) -> dict:
+        "Board.get_all_moves of the position, generated only if it is not cached"
+        entry = self.entry(board.hash)
+        if entry.moves is None:
+            self.misses += 1
+            entry.moves = board.get_all_moves()
+            entry.in_mate = not any(entry.moves.values())
+        else:
+            self.hits += 1
+        return entry.moves
+
+    def in_mate(self, board) -> bool:
+        "Whether the player to move has no legal move, looks for one only if it is not cached"
+        entry = self.entry(board.hash)
+        if entry.in_mate is None:
+            self.misses += 1
+            entry.in_mate = next(board.iter_legal_moves(), None) is None
+        else:
+            self.hits += 1
+        return entry.in_mate
+
+    def get_san(self, key: int, code: int) -> str:
+        "SAN of the move (Move.code) from the position, None if it is not cached"
+        san = self.entry(key).san.get(code)
+        if san is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return san
+
+    def store_san(self, key: int, code: int, san: str):
+        self.entry(key).san[code] = san
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries), 'capacity': self.size, 'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions, 'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
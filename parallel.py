@@ -0,0 +1,188 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from chess import Board, Move
+from constants import STARTING_FEN
+from search import Searcher, SearchResult, SearchTimeout, INFINITY, MATE_BOUND, MAX_PLY
+from transposition import TranspositionTable
+
+
+# Every worker process keeps one searcher, so its transposition table survives between tasks
+_searcher: Searcher = None
+
+
+def _init_worker(tt_size: int):
+    global _searcher
+    _searcher = Searcher(TranspositionTable(tt_size))
+
+
+def _search_root_move(fen: str, code: int, depth: int, alpha: int, beta: int, deadline: float, nodes: int):
+    """
+    Worker task: play one root move (packed) and search the reply in the (alpha, beta) window of the root side.
+    Returns (code, score, nodes, pv, completed), a score outside the window is only a bound.
+    """
+    board = Board(fen, quiet=True)
+    board.make_move(board.decode_move(code))
+
+    movetime = deadline - time.time() if deadline else None
+    if movetime is not None and movetime <= 0:
+        return code, 0, 0, [], False
+
+    _searcher.reset(movetime, nodes)
+    try:
+        # ply 1, the root move has already been made
+        score = -_searcher.negamax(board, depth - 1, -beta, -alpha, 1)
+    except SearchTimeout:
+        return code, 0, _searcher.nodes, [], False
+    pv = [code] + [m.code for m in _searcher.pv[1]]
+    return code, score, _searcher.nodes, pv, True
+
+
+class ParallelSearcher:
+    "Splits the root moves of an iterative deepening search over a pool of worker processes"
+    def __init__(self, workers: int = None, tt_size=1 << 18):
+        self.workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(tt_size,)
+        )
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def search(self, board: Board, depth=MAX_PLY, movetime=None, nodes=None, on_info=None) -> SearchResult:
+        """
+        Same budget and result as Searcher.search. nodes is the budget of each root move.
+        Positions travel to the workers as FEN and moves as packed ints, so repetitions before the root are not seen.
+        """
+        start = time.perf_counter()
+        deadline = time.time() + movetime if movetime else None
+        fen = board.get_fen_notation()
+        root_moves = [m.code for m in board.get_legal_moves()]
+        total_nodes = 0
+        result = None
+
+        for current in range(1, min(depth, MAX_PLY) + 1):
+            if not root_moves:
+                break
+            # The best move of the last iteration gets the full window, its score is the bound of the others
+            code, best_score, searched, best_pv, done = self.pool.submit(
+                _search_root_move, fen, root_moves[0], current, -INFINITY, INFINITY, deadline, nodes
+            ).result()
+            total_nodes += searched
+            if not done:
+                break
+            best = code
+            scores = {code: best_score}
+
+            # The others only have to prove they are worse, with a null window at the current best score.
+            # Moves are handed out one per idle worker so every search starts from the latest bound,
+            # a move that fails high is searched again with an open window to get its score
+            pending = deque((code, False) for code in root_moves[1:])
+            running = {}
+            completed = True
+            while completed and (pending or running):
+                while pending and len(running) < self.workers:
+                    code, full = pending.popleft()
+                    beta = INFINITY if full else best_score + 1
+                    future = self.pool.submit(_search_root_move, fen, code, current, best_score, beta, deadline, nodes)
+                    running[future] = (code, beta)
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    code, beta = running.pop(future)
+                    code, score, searched, pv, done = future.result()
+                    total_nodes += searched
+                    if not done:
+                        completed = False
+                        continue
+                    scores[code] = score
+                    # A fail high is only a lower bound, even under a best score raised meanwhile it can still be better
+                    if score >= beta and beta != INFINITY:
+                        pending.appendleft((code, True))
+                    elif score > best_score:
+                        best, best_score, best_pv = code, score, pv
+            if not completed:
+                for future in running:
+                    future.cancel()
+                break
+
+            # Search the best moves first next iteration
+            root_moves.sort(key=lambda code: (code == best, scores[code]), reverse=True)
+            pv = self._pv_moves(board, best_pv)
+            result = SearchResult(
+                pv[0], best_score, current, total_nodes, pv, time.perf_counter() - start
+            )
+            if on_info:
+                on_info(result)
+            if abs(best_score) >= MATE_BOUND:
+                break
+
+        if result is None:
+            moves = board.get_legal_moves()
+            result = SearchResult(
+                moves[0] if moves else None, 0, 0, total_nodes, moves[:1],
+                time.perf_counter() - start
+            )
+        return result
+
+    @staticmethod
+    def _pv_moves(board: Board, pv: list[int]) -> list[Move]:
+        # Turn the packed moves into Move objects of this board, replaying and taking back the line
+        moves = []
+        for code in pv:
+            move = board.decode_move(code)
+            board.make_move(move)
+            moves.append(move)
+        for _ in moves:
+            board.unmake_move()
+        return moves
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search a position on several cores and report the scaling')
+    parser.add_argument('--fen', default=STARTING_FEN)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--movetime', type=float, help='seconds per search')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--scaling', action='store_true', help='compare the time to depth of the serial search with 1, 2, 4... workers')
+    args = parser.parse_args(argv)
+
+    counts = [args.workers]
+    if args.scaling:
+        counts = sorted({min(1 << i, args.workers) for i in range(args.workers.bit_length() + 1)})
+
+    def report(name, result, base):
+        pv = ' '.join(m.to_uci() for m in result.pv)
+        print(
+            f'{name:<11}  depth {result.depth}  score {result.score}  nodes {result.nodes}'
+            f'  time {result.elapsed:.2f}s  nps {result.nps}  speedup {base / result.elapsed if result.elapsed else 0:.2f}x'
+            f'  pv {pv}'
+        )
+
+    # Speedup is time to depth against the serial search, a parallel search that visits more nodes isn't faster
+    base = None
+    if args.scaling:
+        serial = Searcher().search(Board(args.fen, quiet=True), depth=args.depth, movetime=args.movetime)
+        base = serial.elapsed
+        report('serial', serial, base)
+    for workers in counts:
+        board = Board(args.fen, quiet=True)
+        with ParallelSearcher(workers) as searcher:
+            result = searcher.search(board, depth=args.depth, movetime=args.movetime)
+        base = base or result.elapsed
+        report(f'workers {workers:>3}', result, base)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
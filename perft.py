@@ -0,0 +1,115 @@
+import argparse
+import sys
+import time
+
+from chess import Board
+from constants import STARTING_FEN
+import instrumentation
+
+
+# Reference positions and their known leaf node counts per depth
+# Source: https://www.chessprogramming.org/Perft_Results
+PERFT_SUITE = [
+    ('startpos', STARTING_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+]
+
+
+def perft(board: Board, depth: int) -> int:
+    "Counts the leaf nodes of the legal move tree to the given depth"
+    if depth == 0:
+        return 1
+
+    moves = board.get_legal_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def divide(board: Board, depth: int) -> dict[str, int]:
+    "Leaf node counts split by root move, keyed by the move in UCI notation"
+    counts = {}
+    for move in board.get_legal_moves():
+        board.make_move(move)
+        counts[move.to_uci()] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+
+def run_suite(max_depth: int, out=sys.stdout) -> bool:
+    "Runs every reference position up to max_depth, returns True if all counts match"
+    passed = True
+    total_nodes = 0
+    total_time = 0
+    for name, fen, expected in PERFT_SUITE:
+        board = Board(fen, quiet=True)
+        for depth, count in expected.items():
+            if depth > max_depth:
+                break
+
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+
+            ok = nodes == count
+            passed = passed and ok
+            print(
+                f'{name:<10} depth {depth}  {nodes:>10}  {"ok" if ok else f"FAIL (expected {count})"}'
+                f'  {elapsed:.3f}s  {nodes / elapsed if elapsed else 0:.0f} nps',
+                file=out
+            )
+
+    print(f'Total: {total_nodes} nodes in {total_time:.3f}s ({total_nodes / total_time if total_time else 0:.0f} nps)', file=out)
+    return passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count move generation leaf nodes and measure throughput')
+    parser.add_argument('depth', type=int, nargs='?', default=3)
+    parser.add_argument('--fen', default=STARTING_FEN, help='position to start from')
+    parser.add_argument('--divide', action='store_true', help='print node counts per root move')
+    parser.add_argument('--suite', action='store_true', help='verify the reference positions up to depth')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.profiling(args.profile, args.stats):
+        if args.suite:
+            return 0 if run_suite(args.depth) else 1
+
+        board = Board(args.fen)
+        start = time.perf_counter()
+        if args.divide:
+            counts = divide(board, args.depth)
+            for uci, nodes in sorted(counts.items()):
+                print(f'{uci}: {nodes}')
+            nodes = sum(counts.values())
+        else:
+            nodes = perft(board, args.depth)
+        elapsed = time.perf_counter() - start
+
+        print(f'\nNodes: {nodes}')
+        print(f'Time: {elapsed:.3f}s')
+        print(f'NPS: {nodes / elapsed if elapsed else 0:.0f}')
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import argparse
+import re
+import sys
+import time
+
+from chess import Board, Move
+from constants import STARTING_FEN
+from movecache import MoveCache
+import instrumentation
+
+
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+# Comments, variations, NAGs, move numbers, results and everything else as a move
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|\(|\)|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s(){};]+')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+# The seven tag roster, written first and in this order
+STANDARD_HEADERS = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+
+class PGNGame:
+    "Headers, SAN moves and result of one game"
+    def __init__(self, headers: dict[str, str] = None, moves: list[str] = None, result='*'):
+        self.headers = headers or {}
+        self.moves = moves or []
+        self.result = result
+
+    @property
+    def starting_fen(self):
+        return self.headers.get('FEN', STARTING_FEN)
+
+    def __repr__(self):
+        return f'[{self.headers.get("White", "?")} - {self.headers.get("Black", "?")} {self.result}, {len(self.moves)} moves]'
+
+
+def _parse_movetext(movetext: str, game: PGNGame):
+    depth = 0
+    for token in TOKEN_PATTERN.findall(movetext):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth or token[0] in '{;$' or token[0].isdigit() and token.endswith('.'):
+            # Variations, comments, NAGs and move numbers carry no moves of the main line
+            continue
+        elif token in RESULTS:
+            game.result = token
+        else:
+            game.moves.append(token)
+
+
+def read_games(lines):
+    """
+    Yields the games of a PGN file (or any iterable of lines) one at a time.
+    Only the text of the game being parsed is kept in memory. Lines are kept apart,
+    a ; comment only runs to the end of its line:
+
+    >>> next(read_games(['1. e4 e5 ; a comment', '2. Nf3 Nc6 1-0'])).moves
+    ['e4', 'e5', 'Nf3', 'Nc6']
+    """
+    headers = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        header = HEADER_PATTERN.match(line) if line.startswith('[') else None
+        if header:
+            if movetext:
+                # A tag after movetext starts the next game
+                game = PGNGame(headers)
+                _parse_movetext('\n'.join(movetext), game)
+                yield game
+                headers, movetext = {}, []
+            headers[header.group(1)] = header.group(2)
+        elif line and not line.startswith('%'):
+            movetext.append(line)
+
+    if headers or movetext:
+        game = PGNGame(headers)
+        _parse_movetext('\n'.join(movetext), game)
+        yield game
+
+
+def replay_game(game: PGNGame, board: Board = None, move_cache: MoveCache = None) -> Board:
+    "Plays every move of the game through Board.move_piece, raises ValueError on an illegal or unknown move"
+    board = board or Board(game.starting_fen, quiet=True, move_cache=move_cache)
+    for number, san in enumerate(game.moves):
+        try:
+            move = board.parse_san(san)
+        except ValueError as e:
+            raise ValueError(f'Move {number // 2 + 1}: {e}') from None
+        board.move_piece(move.piece, move.newpos, move.promotion)
+    return board
+
+
+def board_to_game(board: Board, headers: dict[str, str] = None, result='*') -> PGNGame:
+    "PGNGame of the moves played on a board, which is taken back to the start and replayed to write SAN"
+    moves: list[Move] = []
+    while board.history:
+        moves.append(board.unmake_move())
+
+    headers = dict(headers or {})
+    fen = board.get_fen_notation()
+    if fen != STARTING_FEN:
+        headers.setdefault('SetUp', '1')
+        headers.setdefault('FEN', fen)
+
+    sans = []
+    for move in reversed(moves):
+        sans.append(board.get_san(move))
+        board.make_move(move)
+    return PGNGame(headers, sans, result)
+
+
+def write_game(out, game: PGNGame, width=80):
+    "Writes a game in PGN export format, movetext wrapped to width characters"
+    headers = dict(game.headers)
+    headers['Result'] = game.result
+    for key in STANDARD_HEADERS:
+        out.write(f'[{key} "{headers.pop(key, "?")}"]\n')
+    for key, value in headers.items():
+        out.write(f'[{key} "{value}"]\n')
+    out.write('\n')
+
+    # Move numbers follow the starting position, which may have black to move
+    fields = game.starting_fen.split()
+    fullmove, black = int(fields[5]), fields[1] == 'b'
+    tokens = []
+    for i, san in enumerate(game.moves):
+        if not black:
+            tokens.append(f'{fullmove}.')
+        elif i == 0:
+            tokens.append(f'{fullmove}...')
+        tokens.append(san)
+        if black:
+            fullmove += 1
+        black = not black
+    tokens.append(game.result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > width:
+            out.write(line + '\n')
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    out.write(line + '\n\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay every game of a PGN file and report the throughput')
+    parser.add_argument('pgn', help='PGN file to read')
+    parser.add_argument('--out', help='write the replayed games back out as PGN')
+    parser.add_argument('--cache', type=int, metavar='POSITIONS', help='share a move cache of this size between the games')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.profiling(args.profile, args.stats):
+        out = open(args.out, 'w') if args.out else None
+        move_cache = MoveCache(args.cache) if args.cache else None
+        games = moves = errors = 0
+        start = time.perf_counter()
+        with open(args.pgn, encoding='utf-8', errors='replace') as f:
+            for game in read_games(f):
+                games += 1
+                try:
+                    board = replay_game(game, move_cache=move_cache)
+                except ValueError as e:
+                    errors += 1
+                    print(f'Game {games} {game}: {e}', file=sys.stderr)
+                    continue
+                moves += len(game.moves)
+                if out:
+                    write_game(out, board_to_game(board, game.headers, game.result))
+        elapsed = time.perf_counter() - start
+        if out:
+            out.close()
+
+        print(f'Games: {games} ({errors} with errors)')
+        print(f'Moves: {moves}')
+        print(f'Time: {elapsed:.3f}s ({games / elapsed if elapsed else 0:.1f} games/s, {moves / elapsed if elapsed else 0:.0f} moves/s)')
+        if move_cache:
+            cache = move_cache.stats()
+            print(f'Move cache: {cache["hit_rate"]:.1%} hits, {cache["size"]} positions, {cache["evictions"]} evicted')
+        return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from chess import Board
+from pgn import read_games
+from polyglot import polyglot_key
+import instrumentation
+
+
+# Magic, version, record count and game count. The records follow, then one result code byte per game
+HEADER = struct.Struct('>4sIQQ')
+MAGIC, VERSION = b'PCIX', 2
+# Position key, game id, ply and packed next move (Move.code).
+# Big endian, so sorting the raw records sorts by key, then game and ply
+RECORD = struct.Struct('>QIHH')
+KEY = struct.Struct('>Q')
+# Next move of the last position of a game
+NO_MOVE = 0xFFFF
+# Result codes, in the order of the white / draw / black counts
+RESULT_CODES = {'1-0': 0, '1/2-1/2': 1, '0-1': 2}
+UNKNOWN_RESULT = 3
+# Records sorted in memory before they are spilled to a run file
+RUN_SIZE = 1 << 20
+
+
+def game_records(game_id: int, game):
+    """
+    Yields the record of every position of a game, keyed by its Polyglot hash.
+    On an illegal move the position it was played from is yielded without a next move, then ValueError is raised.
+    """
+    board = Board(game.starting_fen, quiet=True)
+    for ply, san in enumerate(game.moves):
+        key = polyglot_key(board)
+        try:
+            move = board.parse_san(san)
+        except ValueError:
+            yield RECORD.pack(key, game_id, ply, NO_MOVE)
+            raise
+        yield RECORD.pack(key, game_id, ply, move.code)
+        board.make_move(move)
+    yield RECORD.pack(polyglot_key(board), game_id, len(game.moves), NO_MOVE)
+
+
+def _write_run(records: list[bytes]) -> str:
+    records.sort()
+    fd, path = tempfile.mkstemp(suffix='.run')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b''.join(records))
+    return path
+
+
+def _read_run(path: str):
+    with open(path, 'rb') as f:
+        while record := f.read(RECORD.size):
+            yield record
+
+
+def build_index(games, path: str, run_size=RUN_SIZE, on_error=None) -> tuple[int, int]:
+    """
+    Writes the sorted index of every position of the games, returns (games, positions).
+    Records are sorted in runs of run_size and merged from temporary files, so memory stays bounded on any corpus.
+    Games are numbered from 0 in input order, a game with an illegal move keeps the positions before it.
+    """
+    records, runs = [], []
+    results = bytearray()
+    try:
+        for game_id, game in enumerate(games):
+            results.append(RESULT_CODES.get(game.result, UNKNOWN_RESULT))
+            try:
+                # Extending from the generator keeps the records yielded before an illegal move
+                records.extend(game_records(game_id, game))
+            except ValueError as e:
+                if on_error:
+                    on_error(game_id, game, e)
+            if len(records) >= run_size:
+                runs.append(_write_run(records))
+                records = []
+
+        records.sort()
+        count = len(records) + sum(os.path.getsize(run) // RECORD.size for run in runs)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, count, len(results)))
+            for record in heapq.merge(records, *(_read_run(run) for run in runs)):
+                f.write(record)
+            f.write(results)
+    finally:
+        for run in runs:
+            os.remove(run)
+    return len(results), count
+
+
+class PositionIndex:
+    """
+    Sorted position index written by build_index. The file is memory-mapped and binary searched in place,
+    so opening it costs nothing and a query reads O(log n) records plus the ones of the position.
+    """
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.games = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'Not a position index: {path}')
+        self.results_offset = HEADER.size + self.count * RECORD.size
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _lower_bound(self, key: int) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, HEADER.size + middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def result(self, game_id: int) -> int:
+        "Result code of a game, an index of the white / draw / black counts or UNKNOWN_RESULT"
+        return self.data[self.results_offset + game_id]
+
+    def entries(self, key: int):
+        "Yields (game id, ply, next move code) of every record of the key, by game id and ply"
+        # The records of a key are one block, found with two searches and unpacked in one go
+        start, end = self._lower_bound(key), self._lower_bound(key + 1)
+        block = self.data[HEADER.size + start * RECORD.size:HEADER.size + end * RECORD.size]
+        for _, game_id, ply, move in RECORD.iter_unpack(block):
+            yield game_id, ply, move
+
+    def query(self, board: Board) -> dict:
+        """
+        Games that reached the position and its statistics: results as [white, draw, black] wins,
+        and per next move (in UCI) how often it was played and the results it led to
+        """
+        games = []
+        # Counts of white wins, draws, black wins and unknown results, overall and by next move code
+        results = [0, 0, 0, 0]
+        moves = defaultdict(lambda: [0, 0, 0, 0])
+        for game_id, _, move in self.entries(polyglot_key(board)):
+            # A game passing the position twice is counted once, by its first visit (records come by ply)
+            if games and games[-1] == game_id:
+                continue
+            games.append(game_id)
+            result = self.result(game_id)
+            results[result] += 1
+            if move != NO_MOVE:
+                moves[move][result] += 1
+
+        by_move = {
+            board.decode_move(code).to_uci(): {'count': sum(counts), 'results': counts[:3]}
+            for code, counts in sorted(moves.items(), key=lambda item: -sum(item[1]))
+        }
+        return {'games': games, 'results': results[:3], 'moves': by_move}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index every position of a PGN corpus and look positions up')
+    parser.add_argument('index', help='index file')
+    parser.add_argument('--build', metavar='PGN', help='(re)build the index from every game of the PGN file')
+    parser.add_argument('--fen', help='position to look up, the starting position by default')
+    parser.add_argument('--moves', default='', help='UCI moves played from the position before looking it up')
+    parser.add_argument('--games', type=int, default=10, help='game ids to list')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.profiling(args.profile, args.stats):
+        if args.build:
+            def report(game_id, game, error):
+                print(f'Game {game_id} {game}: {error}', file=sys.stderr)
+
+            start = time.perf_counter()
+            with open(args.build, encoding='utf-8', errors='replace') as f:
+                games, positions = build_index(read_games(f), args.index, on_error=report)
+            elapsed = time.perf_counter() - start
+            print(f'Indexed {positions} positions of {games} games in {elapsed:.2f}s ({positions / elapsed:.0f} positions/s)')
+
+        board = Board(args.fen, quiet=True) if args.fen else Board(quiet=True)
+        for uci in args.moves.split():
+            board.push_uci(uci)
+        with PositionIndex(args.index) as index:
+            start = time.perf_counter()
+            result = index.query(board)
+            elapsed = time.perf_counter() - start
+
+        white, draw, black = result['results']
+        print(f'{len(result["games"])} games (+{white} ={draw} -{black}) in {elapsed * 1000:.2f}ms over {len(index)} positions')
+        if result['games']:
+            print('Games:', ' '.join(map(str, result['games'][:args.games])) + (' ...' if len(result['games']) > args.games else ''))
+        for uci, stats in result['moves'].items():
+            white, draw, black = stats['results']
+            print(f'{uci:<6} {stats["count"]:>8}  +{white} ={draw} -{black}')
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
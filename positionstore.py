@@ -0,0 +1,147 @@
+import argparse
+import mmap
+import os
+import sys
+import time
+
+from chess import Board, PACKED_POSITION
+from pgn import read_games
+import instrumentation
+
+
+RECORD = PACKED_POSITION.size
+
+
+class PositionWriter:
+    "Appends Board.to_bytes records to a position store file, buffered"
+    def __init__(self, path: str):
+        self.file = open(path, 'ab')
+        self.count = 0
+
+    def append(self, board: Board):
+        self.file.write(board.to_bytes())
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PositionStore:
+    """
+    Append-only file of 32 byte packed positions, read through a memory map.
+    Indexing copies out one record as bytes. Iteration and fields() scan memoryview slices of the map without copying,
+    those views must be dropped before the store is closed, the map can't be closed while they point into it.
+    """
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        # An empty file can't be mapped, and has nothing to read anyway
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.view = memoryview(self.data)
+        # A record cut short by an interrupted append is ignored
+        self.count = size // RECORD
+
+    def close(self):
+        try:
+            # The memoryview has to go before the map it points into
+            self.view.release()
+            if self.data:
+                self.data.close()
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('position index out of range')
+        return self.data[index * RECORD:(index + 1) * RECORD]
+
+    def __iter__(self):
+        view = self.view
+        for offset in range(0, self.count * RECORD, RECORD):
+            yield view[offset:offset + RECORD]
+
+    def fields(self):
+        "Yields the unpacked PACKED_POSITION fields of every record, without building boards"
+        return PACKED_POSITION.iter_unpack(self.view[:self.count * RECORD])
+
+    def board(self, index: int, move_cache=None) -> Board:
+        return Board.from_bytes(self[index], move_cache)
+
+
+def add_games(writer: PositionWriter, path: str) -> int:
+    "Appends every position of every game of a PGN file, returns the number of games"
+    games = 0
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for game in read_games(f):
+            board = Board(game.starting_fen, quiet=True)
+            writer.append(board)
+            try:
+                for san in game.moves:
+                    board.make_move(board.parse_san(san))
+                    writer.append(board)
+            except ValueError as e:
+                print(f'Game {games + 1} {game}: {e}', file=sys.stderr)
+            games += 1
+    return games
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Append-only store of 32 byte packed positions')
+    parser.add_argument('store', help='store file, created when positions are added to it')
+    parser.add_argument('--add-pgn', metavar='PGN', help='append every position of every game')
+    parser.add_argument('--add-fen', metavar='FILE', help='append the position of every FEN line')
+    parser.add_argument('--show', type=int, metavar='INDEX', help='print the FEN of a stored position')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.profiling(args.profile, args.stats):
+        if args.add_pgn or args.add_fen:
+            start = time.perf_counter()
+            with PositionWriter(args.store) as writer:
+                if args.add_pgn:
+                    add_games(writer, args.add_pgn)
+                if args.add_fen:
+                    with open(args.add_fen) as f:
+                        for line in f:
+                            if line.strip():
+                                writer.append(Board(line.strip(), quiet=True))
+            print(f'Added {writer.count} positions in {time.perf_counter() - start:.2f}s')
+
+        with PositionStore(args.store) as store:
+            if args.show is not None:
+                print(store.board(args.show).get_fen_notation())
+                return 0
+
+            # A scan that never builds a board: pieces and side to move straight from the records
+            start = time.perf_counter()
+            pieces = black = 0
+            for occupied, _, _, black_to_move, _, _ in store.fields():
+                pieces += occupied.bit_count()
+                black += black_to_move
+            elapsed = time.perf_counter() - start
+            size = len(store) * RECORD
+            print(f'Positions: {len(store)} ({size / 1024 / 1024:.1f} MB), {black} with black to move')
+            print(f'Average pieces: {pieces / len(store) if len(store) else 0:.1f}')
+            print(f'Scan: {elapsed:.3f}s ({len(store) / elapsed if elapsed else 0:.0f} positions/s, {size / elapsed / 1024 / 1024 if elapsed else 0:.0f} MB/s)')
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
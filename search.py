@@ -0,0 +1,271 @@
+import time
+
+from chess import Board, Move
+from constants import MOVE50_LIMIT
+from evaluation import PIECE_VALUES, evaluate
+from transposition import TranspositionTable, EXACT, LOWERBOUND, UPPERBOUND
+
+
+MAX_PLY = 64
+INFINITY = 1_000_000
+MATE_SCORE = 100_000
+# Scores beyond this are mates, stored in the table relative to the node instead of the root
+MATE_BOUND = MATE_SCORE - MAX_PLY
+
+# How many nodes are searched between two budget checks
+CHECK_INTERVAL = 1024
+
+
+class SearchTimeout(Exception):
+    "Raised inside the search when the node or time budget runs out"
+
+
+class SearchResult:
+    def __init__(self, move: Move, score: int, depth: int, nodes: int, pv: list[Move], elapsed: float):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.pv = pv
+        self.elapsed = elapsed
+
+    @property
+    def nps(self):
+        return int(self.nodes / self.elapsed) if self.elapsed else 0
+
+    def __repr__(self):
+        pv = ' '.join(m.to_uci() for m in self.pv)
+        return f'[depth {self.depth} score {self.score} nodes {self.nodes} pv {pv}]'
+
+
+def move_key(move: Move) -> int:
+    "Identifies a move independently of the Move object, used by the table, killers and ordering"
+    return move.code
+
+
+def captured_piece(board: Board, move: Move):
+    "The piece a move would capture, if any"
+    piece = board.get_piece(move.newpos)
+    if not piece and move.piece.piece == 'PAWN' and move.newpos == board.ep_square:
+        piece = board.board[move.newpos.y - move.piece.increment][move.newpos.x]
+    return piece
+
+
+class Searcher:
+    "Negamax alpha-beta search with iterative deepening, quiescence and a transposition table"
+    def __init__(self, tt: TranspositionTable = None):
+        self.tt = tt or TranspositionTable()
+        self.nodes = 0
+        self.stopped = False
+        self.max_nodes = None
+        self.deadline = None
+        self.killers = []
+        self.history = {}
+        self.pv = []
+
+    def stop(self):
+        "Ask a running search to return its last completed iteration, safe to call from another thread"
+        self.stopped = True
+
+    def search(self, board: Board, depth=MAX_PLY, movetime=None, nodes=None, on_info=None) -> SearchResult:
+        """
+        Search the position to the given depth, or until movetime seconds or the node budget run out.
+        on_info is called with the SearchResult of every completed iteration.
+        """
+        start = time.perf_counter()
+        self.reset(movetime, nodes)
+        history_length = len(board.history)
+        result = None
+        for current in range(1, min(depth, MAX_PLY) + 1):
+            self.pv = [[] for _ in range(MAX_PLY + 1)]
+            try:
+                score = self.negamax(board, current, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                # Unwind the moves made by the interrupted iteration
+                while len(board.history) > history_length:
+                    board.unmake_move()
+                break
+
+            pv = self.pv[0]
+            result = SearchResult(
+                pv[0] if pv else None, score, current, self.nodes, pv,
+                time.perf_counter() - start
+            )
+            if on_info:
+                on_info(result)
+            # No legal moves or a forced mate found, deeper iterations won't change anything
+            if not pv or abs(score) >= MATE_BOUND:
+                break
+
+        if result is None:
+            # Budget ran out before the first iteration, fall back to any legal move
+            moves = board.get_legal_moves()
+            result = SearchResult(
+                moves[0] if moves else None, 0, 0, self.nodes, moves[:1],
+                time.perf_counter() - start
+            )
+        return result
+
+    def reset(self, movetime=None, nodes=None):
+        "Start a new search with the given budget, keeping only the transposition table"
+        self.nodes = 0
+        self.stopped = False
+        self.max_nodes = nodes
+        self.deadline = time.perf_counter() + movetime if movetime else None
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.history = {}
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.tt.new_search()
+
+    def _check_budget(self):
+        if self.stopped:
+            raise SearchTimeout()
+        if self.max_nodes and self.nodes >= self.max_nodes:
+            raise SearchTimeout()
+        if self.deadline and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def negamax(self, board: Board, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            self._check_budget()
+        self.pv[ply] = []
+
+        if ply and (board.move50 >= MOVE50_LIMIT or board.is_repetition(2)):
+            return 0
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(board, alpha, beta, ply)
+
+        # Use the stored result if it was searched deep enough
+        tt_move = None
+        entry = self.tt.probe(board.hash)
+        if entry:
+            tt_depth, tt_score, tt_flag, tt_move = entry
+            if ply and tt_depth >= depth:
+                tt_score = self._score_from_tt(tt_score, ply)
+                if (
+                    tt_flag == EXACT
+                    or (tt_flag == LOWERBOUND and tt_score >= beta)
+                    or (tt_flag == UPPERBOUND and tt_score <= alpha)
+                ):
+                    return tt_score
+
+        moves = board.get_legal_moves()
+        if not moves:
+            # Checkmate (prefer the shortest one) or stalemate
+            return -MATE_SCORE + ply if board.in_check else 0
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, None
+        for move in self.order_moves(board, moves, ply, tt_move):
+            board.make_move(move)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+            if alpha >= beta:
+                if not captured_piece(board, move):
+                    self._update_quiet(move, depth, ply)
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPERBOUND
+        elif best_score >= beta:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        self.tt.store(board.hash, depth, self._score_to_tt(best_score, ply), flag, move_key(best_move))
+        return best_score
+
+    def quiescence(self, board: Board, alpha: int, beta: int, ply: int) -> int:
+        "Only searches captures and queen promotions (or every evasion when in check) until the position is quiet"
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            self._check_budget()
+
+        if board.in_check:
+            moves = board.get_legal_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+            stand_pat = -INFINITY
+        else:
+            # Stalemates are left to the main search, standing pat is assumed to be possible
+            stand_pat = evaluate(board)
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = [m for m in board.get_legal_moves(captures_only=True) if m.promotion in (None, 'Q')]
+
+        if ply >= MAX_PLY:
+            return max(stand_pat, evaluate(board))
+
+        best_score = stand_pat
+        for move in self.order_moves(board, moves, ply, None):
+            board.make_move(move)
+            score = -self.quiescence(board, -beta, -alpha, ply + 1)
+            board.unmake_move()
+
+            if score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        return best_score
+
+    def order_moves(self, board: Board, moves: list[Move], ply: int, tt_move) -> list[Move]:
+        "Table move first, then captures by MVV-LVA, promotions, killers and the history heuristic"
+        killers = self.killers[ply]
+        history = self.history
+
+        def score(move):
+            key = move_key(move)
+            if key == tt_move:
+                return 10_000_000
+            victim = captured_piece(board, move)
+            if victim:
+                return 1_000_000 + 10 * PIECE_VALUES[victim.piece] - PIECE_VALUES[move.piece.piece]
+            if move.promotion == 'Q':
+                return 900_000
+            if key == killers[0]:
+                return 800_000
+            if key == killers[1]:
+                return 700_000
+            return history.get((move.piece.symbol, move.newpos), 0)
+
+        return sorted(moves, key=score, reverse=True)
+
+    def _update_quiet(self, move: Move, depth: int, ply: int):
+        # A quiet move caused a beta cutoff, remember it for siblings and for the same piece later on
+        key = move_key(move)
+        killers = self.killers[ply]
+        if killers[0] != key:
+            killers[1] = killers[0]
+            killers[0] = key
+        history_key = (move.piece.symbol, move.newpos)
+        self.history[history_key] = self.history.get(history_key, 0) + depth * depth
+
+    @staticmethod
+    def _score_to_tt(score: int, ply: int) -> int:
+        if score >= MATE_BOUND:
+            return score + ply
+        if score <= -MATE_BOUND:
+            return score - ply
+        return score
+
+    @staticmethod
+    def _score_from_tt(score: int, ply: int) -> int:
+        if score >= MATE_BOUND:
+            return score - ply
+        if score <= -MATE_BOUND:
+            return score + ply
+        return score
+
+
+def search(board: Board, depth=MAX_PLY, movetime=None, nodes=None, on_info=None) -> SearchResult:
+    "Search the position with a fresh Searcher, see Searcher.search"
+    return Searcher().search(board, depth=depth, movetime=movetime, nodes=nodes, on_info=on_info)
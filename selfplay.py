@@ -0,0 +1,256 @@
+import argparse
+import importlib
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chess import Board, Move
+from constants import STARTING_FEN, MOVE50_LIMIT
+from evaluation import PIECE_VALUES
+from pgn import PGNGame, write_game
+from search import Searcher, captured_piece
+from zobrist import compute_hash
+import instrumentation
+
+
+RESULTS = ('1-0', '0-1', '1/2-1/2')
+
+
+def random_policy(board: Board, rng: random.Random) -> Move:
+    "Any legal move"
+    return rng.choice(board.get_legal_moves())
+
+
+def greedy_policy(board: Board, rng: random.Random) -> Move:
+    "The capture of the most valuable piece, by the least valuable attacker, else a random move"
+    moves = board.get_legal_moves()
+    captures = [(captured_piece(board, m), m) for m in moves]
+    captures = [(PIECE_VALUES[victim.piece] * 10 - PIECE_VALUES[m.piece.piece], m) for victim, m in captures if victim]
+    if not captures:
+        return rng.choice(moves)
+    best = max(score for score, _ in captures)
+    return rng.choice([m for score, m in captures if score == best])
+
+
+class SearchPolicy:
+    "The engine's best move at a fixed depth, node or time budget"
+    def __init__(self, depth=2, movetime=None, nodes=None):
+        self.depth, self.movetime, self.nodes = depth, movetime, nodes
+        self.searcher = Searcher()
+
+    def __call__(self, board: Board, rng: random.Random) -> Move:
+        return self.searcher.search(board, self.depth, self.movetime, self.nodes).move
+
+
+def make_policy(spec: str):
+    """
+    Policy callable (board, rng) -> Move of a spec:
+        random, greedy          built in policies
+        search[:depth]          the engine at the given depth (2 by default)
+        module:attribute        any importable callable, or a class that builds one without arguments
+    """
+    name, _, arg = spec.partition(':')
+    if name == 'random':
+        return random_policy
+    if name == 'greedy':
+        return greedy_policy
+    if name == 'search':
+        return SearchPolicy(int(arg or 2))
+    if not arg:
+        raise ValueError(f'Unknown policy: {spec}')
+    policy = getattr(importlib.import_module(name), arg)
+    return policy() if isinstance(policy, type) else policy
+
+
+def termination(board: Board) -> str:
+    "Why the game is over (checkmate, stalemate, move50, repetition), None while it goes on"
+    if board.in_mate:
+        return 'checkmate' if board.in_check else 'stalemate'
+    if board.move50 >= MOVE50_LIMIT:
+        return 'move50'
+    if board.is_repetition(3):
+        return 'repetition'
+    return None
+
+
+def play_game(white, black, fen=STARTING_FEN, rng: random.Random = None, max_plies: int = None) -> dict:
+    """
+    Plays one game between two policies, returns its result, termination, SAN moves and seconds per move.
+    The incremental hash is checked against a fresh one at the end, a mismatch is reported as an error.
+    """
+    rng = rng or random.Random()
+    board = Board(fen, quiet=True)
+    policies = {'WHITE': white, 'BLACK': black}
+    sans, latencies = [], []
+    perf_counter = time.perf_counter
+
+    reason = termination(board)
+    while reason is None and (max_plies is None or len(sans) < max_plies):
+        start = perf_counter()
+        move = policies[board.turn](board, rng)
+        sans.append(board.move_piece(move.piece, move.newpos, move.promotion))
+        latencies.append(perf_counter() - start)
+        reason = termination(board)
+
+    if reason == 'checkmate':
+        result = '0-1' if board.turn == 'WHITE' else '1-0'
+    elif reason is None:
+        reason, result = 'max plies', '*'
+    else:
+        result = '1/2-1/2'
+    if board.hash != compute_hash(board) or board.hash != Board(board.get_fen_notation(), quiet=True).hash:
+        reason, result = 'error', '*'
+    return {'fen': fen, 'result': result, 'termination': reason, 'moves': sans, 'latencies': latencies}
+
+
+# Policies of a worker process, built on first use and kept between chunks so engines keep their tables
+_policies = {}
+
+
+def _policy(spec: str):
+    if spec not in _policies:
+        _policies[spec] = make_policy(spec)
+    return _policies[spec]
+
+
+def _play_chunk(tasks: list[tuple]) -> list[dict]:
+    "Worker task: plays (round, white spec, black spec, fen, seed, max plies) games"
+    games = []
+    for number, white, black, fen, seed, max_plies in tasks:
+        game = play_game(_policy(white), _policy(black), fen, random.Random(seed), max_plies)
+        game.update(round=number, white=white, black=black)
+        games.append(game)
+    return games
+
+
+def schedule(first: str, second: str, games: int, openings: list[str] = None, seed=0, max_plies=None):
+    "Game tasks in round order, the first policy is white in odd rounds and every opening is played with both colors"
+    openings = openings or [STARTING_FEN]
+    rng = random.Random(seed)
+    for number in range(games):
+        white, black = (first, second) if number % 2 == 0 else (second, first)
+        yield number + 1, white, black, openings[number // 2 % len(openings)], rng.getrandbits(64), max_plies
+
+
+def run_match(tasks, workers: int = None, chunk_size=8):
+    "Yields finished games in round order, chunks of games spread over a process pool with bounded work in flight"
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        chunk = []
+        for task in tasks:
+            chunk.append(task)
+            if len(chunk) == chunk_size:
+                pending.append(pool.submit(_play_chunk, chunk))
+                chunk = []
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        if chunk:
+            pending.append(pool.submit(_play_chunk, chunk))
+        while pending:
+            yield from pending.popleft().result()
+
+
+def to_pgn(game: dict, event='Self-play') -> PGNGame:
+    headers = {
+        'Event': event, 'Site': '-', 'Date': time.strftime('%Y.%m.%d'), 'Round': str(game['round']),
+        'White': game['white'], 'Black': game['black'], 'Termination': game['termination'],
+    }
+    if game['fen'] != STARTING_FEN:
+        headers.update(SetUp='1', FEN=game['fen'])
+    return PGNGame(headers, game['moves'], game['result'])
+
+
+class MatchStats:
+    "Score of the first policy (white in odd rounds), terminations, game lengths and move latencies of a stream of games"
+    def __init__(self, first: str):
+        self.first = first
+        self.score = Counter()
+        self.terminations = Counter()
+        self.lengths = []
+        self.latencies = []
+
+    def add(self, game: dict):
+        result = game['result']
+        if result == '1/2-1/2':
+            self.score['draws'] += 1
+        elif result in RESULTS:
+            first_won = (result == '1-0') == (game['round'] % 2 == 1)
+            self.score['wins' if first_won else 'losses'] += 1
+        self.terminations[game['termination']] += 1
+        self.lengths.append(len(game['moves']))
+        self.latencies.extend(game['latencies'])
+
+    def percentile(self, p) -> float:
+        "Move latency percentile in milliseconds"
+        if not self.latencies:
+            return 0
+        return self.latencies[min(int(len(self.latencies) * p / 100), len(self.latencies) - 1)] * 1000
+
+    def report(self, elapsed: float) -> str:
+        self.latencies.sort()
+        games, plies = len(self.lengths), sum(self.lengths)
+        score = self.score
+        return '\n'.join((
+            f'Games: {games} in {elapsed:.2f}s ({games / elapsed if elapsed else 0:.1f} games/s, {plies / elapsed if elapsed else 0:.0f} moves/s)',
+            f'{self.first}: +{score["wins"]} ={score["draws"]} -{score["losses"]}',
+            'Terminations: ' + ', '.join(f'{name} {count}' for name, count in self.terminations.most_common()),
+            f'Length: {plies / games if games else 0:.1f} plies on average, {min(self.lengths, default=0)} to {max(self.lengths, default=0)}',
+            f'Move latency: p50 {self.percentile(50):.3f}ms  p99 {self.percentile(99):.3f}ms  max {self.percentile(100):.3f}ms',
+        ))
+
+
+def read_openings(path: str) -> list[str]:
+    "FEN of every line of a FEN or EPD file, EPD lines get zero clocks"
+    openings = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split(';')[0].split()
+            if fields:
+                openings.append(' '.join(fields[:6] if len(fields) >= 6 and fields[4].isdigit() else fields[:4] + ['0', '1']))
+    return openings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play games between move policies over a process pool')
+    parser.add_argument('first', nargs='?', default='random', help='random, greedy, search[:depth] or module:callable')
+    parser.add_argument('second', nargs='?', default='random')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--openings', help='FEN or EPD file of starting positions, each is played with both colors')
+    parser.add_argument('--max-plies', type=int, help='adjudicate unfinished games as * after this many plies')
+    parser.add_argument('--pgn', help='write the games to this PGN file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    # Fail on a bad policy here instead of in every worker
+    try:
+        make_policy(args.first), make_policy(args.second)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+
+    with instrumentation.profiling(args.profile, args.stats):
+        openings = read_openings(args.openings) if args.openings else None
+        tasks = schedule(args.first, args.second, args.games, openings, args.seed, args.max_plies)
+
+        stats = MatchStats(args.first)
+        out = open(args.pgn, 'w') if args.pgn else None
+        start = time.perf_counter()
+        for game in run_match(tasks, args.workers, args.chunk_size):
+            stats.add(game)
+            if out:
+                write_game(out, to_pgn(game))
+        elapsed = time.perf_counter() - start
+        if out:
+            out.close()
+
+        print(stats.report(elapsed))
+        return 1 if stats.terminations['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
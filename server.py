@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from chess import Board
+from constants import STARTING_FEN
+from movecache import MoveCache
+import instrumentation
+
+
+DEFAULT_HOST, DEFAULT_PORT = '127.0.0.1', 8765
+
+
+class GameSession:
+    """
+    One hosted game. Commands are lines of text, every command gets exactly one line back:
+        new [fen]       start a new game                      -> ok <fen>
+        move <uci>      play a move (e2e4, e7e8q)             -> ok <san> <status> | illegal <uci> | over <status>
+        moves           legal moves of the player to move     -> moves <uci>...
+        undo            take back the last move               -> ok <status> | error <reason>
+        fen             current position                      -> fen <fen>
+        status          state of the game                     -> status <turn> <status>
+    """
+    def __init__(self, fen=STARTING_FEN, move_cache: MoveCache = None):
+        self.move_cache = move_cache
+        self.board = Board(fen, quiet=True, move_cache=move_cache)
+
+    def handle(self, line: str) -> str:
+        command, _, args = line.strip().partition(' ')
+        handler = getattr(self, f'cmd_{command}', None)
+        if handler is None:
+            return f'error unknown command {command}'
+        return handler(args.strip())
+
+    def cmd_new(self, fen: str) -> str:
+        try:
+            self.board = Board(fen or STARTING_FEN, quiet=True, move_cache=self.move_cache)
+        except (ValueError, IndexError, KeyError):
+            return f'error invalid fen {fen}'
+        return f'ok {self.board.get_fen_notation()}'
+
+    def cmd_move(self, uci: str) -> str:
+        status = self.board.status()
+        if status in ('checkmate', 'stalemate', 'move50'):
+            return f'over {status}'
+        try:
+            # from_uci rejects every move that is not in all_valid_moves
+            move = self.board.from_uci(uci)
+        except ValueError:
+            return f'illegal {uci}'
+        san = self.board.move_piece(move.piece, move.newpos, move.promotion)
+        return f'ok {san} {self.board.status()}'
+
+    def cmd_moves(self, _) -> str:
+        return ' '.join(['moves'] + [m.to_uci() for m in self.board.get_legal_moves()])
+
+    def cmd_undo(self, _) -> str:
+        if self.board.undo_move() is None:
+            return 'error nothing to undo'
+        return f'ok {self.board.status()}'
+
+    def cmd_fen(self, _) -> str:
+        return f'fen {self.board.get_fen_notation()}'
+
+    def cmd_status(self, _) -> str:
+        return f'status {self.board.turn.lower()} {self.board.status()}'
+
+
+class GameServer:
+    "asyncio TCP server hosting one GameSession per connection"
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, move_cache: MoveCache = None):
+        self.host, self.port = host, port
+        # Shared by every session, games mostly go through the same opening positions
+        self.move_cache = move_cache
+        self.sessions = 0
+        self.server: asyncio.AbstractServer = None
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = GameSession(move_cache=self.move_cache)
+        self.sessions += 1
+        try:
+            while line := await reader.readline():
+                if line.strip() == b'quit':
+                    break
+                # A line that isn't UTF-8 still gets its one reply, as an unknown command or an illegal move
+                writer.write(session.handle(line.decode(errors='replace')).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=4096)
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        print(f'Serving games on {self.host}:{self.port}', file=sys.stderr)
+        async with self.server:
+            await self.server.serve_forever()
+
+
+async def _play_random_game(host: str, port: int, moves: int, rng: random.Random, latencies: list[float]):
+    # Load test client: asks for the legal moves and plays a random one until the game ends
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def request(line: str) -> str:
+        start = time.perf_counter()
+        writer.write(line.encode() + b'\n')
+        await writer.drain()
+        reply = (await reader.readline()).decode().strip()
+        latencies.append(time.perf_counter() - start)
+        return reply
+
+    played = 0
+    for _ in range(moves):
+        legal = (await request('moves')).split()[1:]
+        if not legal:
+            break
+        reply = await request(f'move {rng.choice(legal)}')
+        if not reply.startswith('ok'):
+            raise RuntimeError(f'Server rejected a legal move: {reply}')
+        played += 1
+        if reply.split()[-1] in ('checkmate', 'stalemate', 'move50'):
+            break
+    writer.write(b'quit\n')
+    writer.close()
+    await writer.wait_closed()
+    return played
+
+
+async def load_test(host: str, port: int, games: int, moves: int, seed=0) -> dict:
+    "Plays games concurrent random games against a running server, returns throughput and latency percentiles"
+    rng = random.Random(seed)
+    latencies = []
+    start = time.perf_counter()
+    played = await asyncio.gather(*(
+        _play_random_game(host, port, moves, random.Random(rng.random()), latencies) for _ in range(games)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000 if latencies else 0
+
+    return {
+        'games': games, 'moves': sum(played), 'requests': len(latencies), 'elapsed': elapsed,
+        'p50': percentile(50), 'p99': percentile(99), 'max': latencies[-1] * 1000 if latencies else 0,
+    }
+
+
+def session_memory(count: int, moves: int, seed=0) -> float:
+    "Average traced bytes of a GameSession after up to moves random moves"
+    rng = random.Random(seed)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [GameSession() for _ in range(count)]
+    for session in sessions:
+        for _ in range(moves):
+            legal = session.board.get_legal_moves()
+            if not legal:
+                break
+            move = rng.choice(legal)
+            session.handle(f'move {move.to_uci()}')
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless game server and its load test client')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--load-test', type=int, metavar='GAMES', help='play GAMES concurrent games against a server')
+    parser.add_argument('--moves', type=int, default=40, help='moves per load test game')
+    parser.add_argument('--spawn', action='store_true', help='start the server in a subprocess for the load test')
+    parser.add_argument('--move-cache', type=int, default=0, metavar='POSITIONS', help='positions kept in the shared move cache')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.profiling(args.profile, args.stats):
+        if not args.load_test:
+            move_cache = MoveCache(args.move_cache) if args.move_cache else None
+            asyncio.run(GameServer(args.host, args.port, move_cache).serve_forever())
+            return 0
+
+        server = None
+        if args.spawn:
+            server = subprocess.Popen(
+                [sys.executable, __file__, '--host', args.host, '--port', str(args.port), '--move-cache', str(args.move_cache)],
+                stderr=subprocess.PIPE
+            )
+            # Wait for the server to listen
+            server.stderr.readline()
+        try:
+            stats = asyncio.run(load_test(args.host, args.port, args.load_test, args.moves))
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+        print(f'Games: {stats["games"]}  moves: {stats["moves"]}  requests: {stats["requests"]} in {stats["elapsed"]:.2f}s')
+        print(f'Throughput: {stats["moves"] / stats["elapsed"]:.0f} moves/s, {stats["requests"] / stats["elapsed"]:.0f} requests/s')
+        print(f'Latency: p50 {stats["p50"]:.2f}ms  p99 {stats["p99"]:.2f}ms  max {stats["max"]:.2f}ms')
+        print(f'Memory: {session_memory(200, args.moves) / 1024:.1f} KB per game after {args.moves} moves')
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
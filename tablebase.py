@@ -0,0 +1,411 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import defaultdict
+from itertools import product
+
+from bitboard import KING_ATTACKS, OPPONENT
+from chess import Board
+
+
+# Pieces of a material signature in the order they are written and indexed, KQRBNP for each side
+ORDER = 'KQRBNP'
+STRENGTH = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+TURNS = ('WHITE', 'BLACK')
+
+# One byte per position, from the point of view of the player to move:
+# 0 draw, 1..127 wins with mate in that many moves, 128 + n gets mated in n moves, 255 is not a legal position
+DRAW, LOSS, ILLEGAL = 0, 128, 255
+WIN, UNKNOWN = 1, 2
+
+HEADER = struct.Struct('<4s8sI')
+MAGIC = b'PCTB'
+EXTENSION = '.tb'
+
+
+def _symmetries():
+    # The 8 symmetries of the board as square maps, mirrors first so pawn tables can use the first two
+    maps = []
+    for transpose, flip_y, flip_x in ((0, 0, 0), (0, 0, 1), (0, 1, 0), (0, 1, 1), (1, 0, 0), (1, 0, 1), (1, 1, 0), (1, 1, 1)):
+        squares = []
+        for sq in range(64):
+            x, y = sq % 8, sq // 8
+            if transpose:
+                x, y = y, x
+            x, y = 7 - x if flip_x else x, 7 - y if flip_y else y
+            squares.append(y * 8 + x)
+        maps.append(squares)
+    return maps
+
+
+SYMMETRIES = _symmetries()
+# Without pawns the white king is moved into the a1-d1-d4 triangle, with pawns only mirrored onto files a-d
+TRIANGLE = [y * 8 + x for y in range(4, 8) for x in range(4) if 7 - y <= x]
+HALF_BOARD = [y * 8 + x for y in range(8) for x in range(4)]
+
+
+def _king_transforms(allowed: list[int], symmetries: list[list[int]]):
+    # For every square, the first symmetry that maps it into the allowed squares
+    return [next(s for s in symmetries if s[sq] in allowed) for sq in range(64)]
+
+
+PAWNLESS_TRANSFORMS = _king_transforms(TRIANGLE, SYMMETRIES)
+PAWN_TRANSFORMS = _king_transforms(HALF_BOARD, SYMMETRIES[:2])
+
+
+def canonical(pieces: list[tuple[str, int]], turn: str):
+    """
+    Material signature (e.g. KQK), squares in table order and turn of a set of (symbol, square).
+    The stronger side is always white, positions with a stronger black are mirrored and recoloured.
+    """
+    white = ''.join(sorted((s for s, _ in pieces if s.isupper()), key=ORDER.index))
+    black = ''.join(sorted((s.upper() for s, _ in pieces if s.islower()), key=ORDER.index))
+    strength = lambda side: (sum(STRENGTH[s] for s in side), side)
+    if strength(black) > strength(white):
+        pieces = [(s.swapcase(), sq ^ 56) for s, sq in pieces]
+        white, black, turn = black, white, OPPONENT[turn]
+    pieces = sorted(pieces, key=lambda p: (p[0].islower(), ORDER.index(p[0].upper())))
+    return white + black, [sq for _, sq in pieces], turn
+
+
+def encode_value(state: int, plies: int) -> int:
+    if state == WIN:
+        return (plies + 1) // 2
+    if state == LOSS:
+        return LOSS + plies // 2
+    return DRAW
+
+
+def decode_value(value: int):
+    "(state, plies) of a stored byte, state is WIN, LOSS, DRAW or ILLEGAL"
+    if value == ILLEGAL:
+        return ILLEGAL, 0
+    if value >= LOSS:
+        return LOSS, 2 * (value - LOSS)
+    if value:
+        return WIN, 2 * value - 1
+    return DRAW, 0
+
+
+class TableSpec:
+    "Index layout of one material set: turn, white king slot, then one full board square per other piece"
+    def __init__(self, material: str):
+        split = material.index('K', 1)
+        self.material = material
+        self.symbols = list(material[:split]) + list(material[split:].lower())
+        self.pawns = 'P' in material
+        self.king_squares = HALF_BOARD if self.pawns else TRIANGLE
+        self.transforms = PAWN_TRANSFORMS if self.pawns else PAWNLESS_TRANSFORMS
+        self.king_slots = {sq: i for i, sq in enumerate(self.king_squares)}
+        self.half = len(self.king_squares) * 64 ** (len(self.symbols) - 1)
+        self.size = 2 * self.half
+
+    def index(self, squares: list[int], turn: str) -> int:
+        transform = self.transforms[squares[0]]
+        index = self.king_slots[transform[squares[0]]]
+        for sq in squares[1:]:
+            index = index * 64 + transform[sq]
+        return index + (self.half if turn == 'BLACK' else 0)
+
+    def positions(self):
+        "Yields (index, squares, turn) of every slot of the table, in index order"
+        index = 0
+        for turn in TURNS:
+            for king in self.king_squares:
+                for others in product(range(64), repeat=len(self.symbols) - 1):
+                    yield index, (king,) + others, turn
+                    index += 1
+
+    def is_placeable(self, squares) -> bool:
+        "Distinct squares, no pawn on the first or last rank and kings apart"
+        if len(set(squares)) != len(squares):
+            return False
+        for symbol, sq in zip(self.symbols, squares):
+            if symbol in 'Pp' and sq // 8 in (0, 7):
+                return False
+        kings = [sq for symbol, sq in zip(self.symbols, squares) if symbol in 'Kk']
+        return not KING_ATTACKS[kings[0]] >> kings[1] & 1
+
+    def fen(self, squares, turn: str) -> str:
+        grid = [None] * 64
+        for symbol, sq in zip(self.symbols, squares):
+            grid[sq] = symbol
+        rows = []
+        for y in range(8):
+            row, empty = '', 0
+            for symbol in grid[y * 8:y * 8 + 8]:
+                if symbol:
+                    row += (str(empty) if empty else '') + symbol
+                    empty = 0
+                else:
+                    empty += 1
+            rows.append(row + (str(empty) if empty else ''))
+        return f'{"/".join(rows)} {turn[0].lower()} - - 0 1'
+
+
+class TablebaseGenerator:
+    """
+    Solves material sets by retrograde analysis over the legal moves of Board.
+    Captures and promotions lead into smaller sets, which are generated first (or loaded from directory).
+    """
+    def __init__(self, directory: str, verbose=True):
+        self.directory = directory
+        self.verbose = verbose
+        self.tables: dict[str, bytes] = {}
+
+    def table(self, material: str):
+        if material not in self.tables:
+            path = os.path.join(self.directory, material + EXTENSION)
+            if os.path.exists(path):
+                with Tablebase(path) as tb:
+                    self.tables[material] = bytes(tb.values)
+            else:
+                self.tables[material] = self.generate(material)
+                write_table(path, material, self.tables[material])
+        return self.tables[material]
+
+    def lookup(self, pieces: list[tuple[str, int]], turn: str):
+        "(state, plies) of a position of another material set"
+        material, squares, turn = canonical(pieces, turn)
+        if material == 'KK':
+            return DRAW, 0
+        return decode_value(self.table(material)[TableSpec(material).index(squares, turn)])
+
+    def generate(self, material: str) -> bytearray:
+        start = time.perf_counter()
+        spec = TableSpec(material)
+        size = spec.size
+        state = bytearray([ILLEGAL]) * size
+        # Children that are not known to be wins for the opponent, a position is lost once this reaches 0
+        remaining = array('H', bytes(2 * size))
+        # Longest win of the opponent among the children in smaller sets
+        longest = array('H', bytes(2 * size))
+        buckets = defaultdict(list)
+        sources, targets = array('I'), array('I')
+
+        for index, squares, turn in spec.positions():
+            if not spec.is_placeable(squares):
+                continue
+            board = Board(spec.fen(squares, turn), quiet=True)
+            if board.is_check(OPPONENT[turn]):
+                continue
+            state[index] = UNKNOWN
+
+            pieces = list(zip(spec.symbols, squares))
+            moves = 0
+            for oldpos, newposes in board.all_valid_moves.items():
+                moving = squares.index(oldpos.sq)
+                for newpos in newposes:
+                    moves += 1
+                    child = [p for p in pieces if p[1] != newpos.sq]
+                    symbol = pieces[moving][0]
+                    promotions = [symbol]
+                    if symbol in 'Pp' and newpos.y in (0, 7):
+                        promotions = [s if symbol == 'P' else s.lower() for s in 'QRBN']
+                    captured = len(child) < len(pieces)
+
+                    for promotion in promotions:
+                        moved = [(promotion, newpos.sq) if sq == oldpos.sq else (s, sq) for s, sq in child]
+                        if not captured and promotion == symbol:
+                            sources.append(index)
+                            targets.append(spec.index([sq for _, sq in moved], OPPONENT[turn]))
+                            remaining[index] += 1
+                            continue
+
+                        child_state, plies = self.lookup(moved, OPPONENT[turn])
+                        if child_state == LOSS:
+                            buckets[plies + 1].append((index, WIN))
+                            remaining[index] += 1
+                        elif child_state == WIN:
+                            longest[index] = max(longest[index], plies)
+                        else:
+                            remaining[index] += 1
+
+            if not moves:
+                if board.in_check:
+                    buckets[0].append((index, LOSS))
+                else:
+                    state[index] = DRAW
+            elif not remaining[index]:
+                # Every move goes into a smaller set that the opponent wins
+                buckets[longest[index] + 1].append((index, LOSS))
+
+        # Predecessors of every position, as offsets into one flat array
+        offsets = array('I', bytes(4 * (size + 1)))
+        for target in targets:
+            offsets[target + 1] += 1
+        for i in range(size):
+            offsets[i + 1] += offsets[i]
+        fill = array('I', offsets)
+        predecessors = array('I', bytes(4 * len(sources)))
+        for source, target in zip(sources, targets):
+            predecessors[fill[target]] = source
+            fill[target] += 1
+        del sources, targets, fill
+
+        # Resolve positions in order of distance to mate, a bucket only receives positions of later plies
+        plies = array('H', bytes(2 * size))
+        current = 0
+        while buckets:
+            for index, result in buckets.pop(current, []):
+                if state[index] != UNKNOWN:
+                    continue
+                state[index], plies[index] = result, current
+                for p in range(offsets[index], offsets[index + 1]):
+                    parent = predecessors[p]
+                    if state[parent] != UNKNOWN:
+                        continue
+                    if result == LOSS:
+                        buckets[current + 1].append((parent, WIN))
+                    else:
+                        remaining[parent] -= 1
+                        if not remaining[parent]:
+                            buckets[max(current, longest[parent]) + 1].append((parent, LOSS))
+            current += 1
+
+        values = bytearray(size)
+        for i in range(size):
+            values[i] = ILLEGAL if state[i] == ILLEGAL else encode_value(state[i], plies[i])
+        if self.verbose:
+            wins = [v for v in values if 0 < v < LOSS]
+            print(
+                f'{material}: {size} positions, {len(wins)} wins, longest mate {max(wins, default=0)} moves'
+                f' in {time.perf_counter() - start:.1f}s', file=sys.stderr
+            )
+        return values
+
+
+def write_table(path: str, material: str, values: bytes):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, material.encode().ljust(8, b'\0'), len(values)))
+        f.write(values)
+
+
+class Tablebase:
+    "One generated table, memory-mapped so probing reads a single byte"
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, material, size = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f'Not a tablebase file: {path}')
+        self.material = material.rstrip(b'\0').decode()
+        self.spec = TableSpec(self.material)
+        self.values = memoryview(self.data)[HEADER.size:HEADER.size + size]
+
+    def close(self):
+        self.values.release()
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Tablebases:
+    "Every table of a directory, probed by the material on the board"
+    def __init__(self, directory: str):
+        self.tables: dict[str, Tablebase] = {}
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(EXTENSION):
+                table = Tablebase(os.path.join(directory, name))
+                self.tables[table.material] = table
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def probe(self, board: Board):
+        """
+        (wdl, moves) of the position for the player to move: wdl is 1 for a win, 0 for a draw, -1 for a loss,
+        moves is the number of moves to mate (None for a draw).
+        None if no table covers the position, or it is illegal (the player not to move is in check).
+        """
+        # Tables have no castling or en passant rights
+        if any(king.castling != [None, None] for king in board.kings.values()):
+            return None
+        if board.ep_square and any(
+            p.piece == 'PAWN' and board.ep_square in targets
+            for p, targets in ((board.get_piece(pos), targets) for pos, targets in board.all_valid_moves.items())
+        ):
+            return None
+
+        material, squares, turn = canonical([(p.symbol, p.sq) for p in board.pieces], board.turn)
+        if material == 'KK':
+            return 0, None
+        table = self.tables.get(material)
+        if table is None:
+            return None
+        state, plies = decode_value(table.values[table.spec.index(squares, turn)])
+        if state == ILLEGAL:
+            return None
+        if state == WIN:
+            return 1, (plies + 1) // 2
+        if state == LOSS:
+            return -1, plies // 2
+        return 0, None
+
+    def best_move(self, board: Board):
+        "The legal move with the best tablebase result (quickest win, slowest loss), None if a result is missing"
+        best, best_score = None, None
+        for move in board.get_legal_moves():
+            board.make_move(move)
+            result = self.probe(board)
+            board.unmake_move()
+            if result is None:
+                return None
+            wdl, moves = result
+            # The result is for the opponent, prefer their quickest loss, then draws, then their slowest win
+            score = -wdl * 1000 + (moves if wdl > 0 else -moves if wdl < 0 else 0)
+            if best_score is None or score > best_score:
+                best, best_score = move, score
+        return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate endgame tablebases by retrograde analysis, or probe them')
+    parser.add_argument('materials', nargs='*', help='material sets to generate, white is the stronger side (KQK, KRK, KPK, KBNK)')
+    parser.add_argument('--dir', default='tablebases', help='directory of the table files')
+    parser.add_argument('--probe', metavar='FEN', help='print the tablebase result of a position')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.dir, exist_ok=True)
+    generator = TablebaseGenerator(args.dir)
+    for material in args.materials:
+        material, _, _ = canonical([(s, 0) for s in material[:material.index('K', 1)]]
+                                   + [(s.lower(), 0) for s in material[material.index('K', 1):]], 'WHITE')
+        generator.table(material)
+
+    if args.probe:
+        board = Board(args.probe, quiet=True)
+        with Tablebases(args.dir) as tablebases:
+            start = time.perf_counter()
+            result = board.probe_tablebase(tablebases)
+            elapsed = time.perf_counter() - start
+            if result is None:
+                print('Not in the tablebases, or illegal')
+                return 1
+            wdl, moves = result
+            print({1: f'Win, mate in {moves}', 0: 'Draw', -1: f'Loss, mated in {moves}'}[wdl])
+            best = tablebases.best_move(board)
+            if best:
+                print(f'Best move: {board.get_san(best)}')
+            print(f'Probe: {elapsed * 1e6:.0f}us')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# Bound types of a stored score
+EXACT, LOWERBOUND, UPPERBOUND = 0, 1, 2
+
+
+class TranspositionTable:
+    "Fixed-size table of search results keyed by the board's zobrist hash"
+    def __init__(self, size=1 << 20):
+        # Round down to a power of two so the slot is a mask of the hash
+        self.size = 1 << (max(size, 1).bit_length() - 1)
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def new_search(self):
+        "Marks every stored entry as old, old entries are always replaced"
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def probe(self, key: int):
+        "Returns (depth, score, flag, move) stored for the position, or None"
+        entry = self.entries[key & self.mask]
+        if entry and entry[0] == key:
+            return entry[1:5]
+        return None
+
+    def store(self, key: int, depth: int, score, flag: int, move=None):
+        index = key & self.mask
+        entry = self.entries[index]
+        # Depth preferred replacement, unless the slot holds the same position or a previous search
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, score, flag, move, self.generation)
+
+    def __len__(self):
+        return sum(1 for entry in self.entries if entry)
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import sys
+
+from chess import Board
+from constants import STARTING_FEN
+from polyglot import PolyglotBook
+from search import Searcher, SearchResult, MATE_SCORE, MATE_BOUND, MAX_PLY
+
+
+ENGINE_NAME = 'Python Chess'
+ENGINE_AUTHOR = 'MashaalSayeed'
+
+# Milliseconds kept back from every timed move for communication with the GUI
+MOVE_OVERHEAD = 50
+# Moves the remaining clock time is spread over when the GUI doesn't send movestogo
+DEFAULT_MOVES_TO_GO = 30
+GO_PARAMETERS = ('depth', 'nodes', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo')
+
+
+def parse_go(tokens: list[str]) -> dict:
+    "Search limits of the arguments of a go command, infinite and ponder map to True"
+    limits = {}
+    tokens = iter(tokens)
+    for token in tokens:
+        if token in ('infinite', 'ponder'):
+            limits[token] = True
+        elif token in GO_PARAMETERS:
+            value = next(tokens, None)
+            if value is not None and value.lstrip('-').isdigit():
+                limits[token] = int(value)
+    return limits
+
+
+def allocate_time(limits: dict, turn: str):
+    "Seconds to search this move, None when the search is not timed"
+    if 'movetime' in limits:
+        return max(limits['movetime'] - MOVE_OVERHEAD, 1) / 1000
+    left = limits.get('wtime' if turn == 'WHITE' else 'btime')
+    if left is None:
+        return None
+    increment = limits.get('winc' if turn == 'WHITE' else 'binc', 0)
+    budget = left / limits.get('movestogo', DEFAULT_MOVES_TO_GO) + increment * 0.8
+    # Never plan to use more than half of the clock on one move
+    budget = min(budget, left / 2) - MOVE_OVERHEAD
+    return max(budget, 1) / 1000
+
+
+def format_score(score: int) -> str:
+    if abs(score) >= MATE_BOUND:
+        moves = (MATE_SCORE - abs(score) + 1) // 2
+        return f'mate {moves if score > 0 else -moves}'
+    return f'cp {score}'
+
+
+def format_info(result: SearchResult) -> str:
+    pv = ' '.join(m.to_uci() for m in result.pv)
+    return (
+        f'info depth {result.depth} score {format_score(result.score)} nodes {result.nodes}'
+        f' nps {result.nps} time {int(result.elapsed * 1000)} pv {pv}'
+    )
+
+
+class UCIEngine:
+    """
+    Universal Chess Interface front end. Commands are read on the asyncio loop while the search runs
+    in a worker thread, so stop and isready are answered while the engine is thinking.
+    """
+    def __init__(self, out=sys.stdout, book: PolyglotBook = None):
+        self.out = out
+        # Opening book moves are played without searching
+        self.book = book
+        self.board = Board(quiet=True)
+        self.searcher = Searcher()
+        self.search_task: asyncio.Task = None
+        # Set by stop, an infinite search only reports its best move after it
+        self.stop_requested = asyncio.Event()
+
+    def send(self, line: str):
+        self.out.write(line + '\n')
+        self.out.flush()
+
+    async def run(self):
+        "Handles commands from stdin until quit or the end of input"
+        loop = asyncio.get_running_loop()
+        while True:
+            # Blocking reads happen on a thread, the loop stays free to report search progress
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line or not await self.handle(line):
+                break
+        await self.stop_search()
+
+    async def handle(self, line: str) -> bool:
+        "Runs one command, returns False on quit"
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'id author {ENGINE_AUTHOR}')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            await self.stop_search()
+            self.searcher.tt.clear()
+            self.board = Board(quiet=True)
+        elif command == 'position':
+            await self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            await self.stop_search()
+            self.start_search(parse_go(args))
+        elif command == 'stop':
+            await self.stop_search()
+        elif command == 'quit':
+            return False
+        elif command not in ('debug', 'setoption', 'register', 'ponderhit'):
+            self.send(f'info string Unknown command: {command}')
+        return True
+
+    def set_position(self, args: list[str]):
+        "position [startpos | fen <fen>] [moves <uci>...]"
+        moves = args.index('moves') if 'moves' in args else len(args)
+        if args and args[0] == 'fen':
+            fen = ' '.join(args[1:moves])
+        else:
+            fen = STARTING_FEN
+
+        try:
+            board = Board(fen, quiet=True)
+        except (ValueError, IndexError, KeyError):
+            self.send(f'info string Invalid FEN: {fen}')
+            return
+        # The moves are played on the board so the search sees repetitions of earlier positions
+        for uci in args[moves + 1:]:
+            try:
+                board.make_move(board.from_uci(uci))
+            except ValueError as e:
+                self.send(f'info string {e}')
+                break
+        self.board = board
+
+    def start_search(self, limits: dict):
+        loop = asyncio.get_running_loop()
+        self.stop_requested.clear()
+
+        def on_info(result: SearchResult):
+            # Called on the search thread, the line is written from the loop to keep output in order
+            loop.call_soon_threadsafe(self.send, format_info(result))
+
+        infinite = limits.get('infinite') or limits.get('ponder')
+        book_move = self.book.choose_move(self.board) if self.book and not infinite else None
+        if book_move:
+            self.send(f'bestmove {book_move.to_uci()}')
+            return
+
+        movetime = None if infinite else allocate_time(limits, self.board.turn)
+        search = asyncio.to_thread(
+            self.searcher.search, self.board, limits.get('depth', MAX_PLY), movetime,
+            limits.get('nodes'), on_info
+        )
+        self.search_task = asyncio.create_task(self._report(search, infinite))
+
+    async def _report(self, search, infinite: bool):
+        result = await search
+        if infinite:
+            # The protocol wants the best move of an infinite search only once it has been stopped
+            await self.stop_requested.wait()
+        best = result.move.to_uci() if result.move else '0000'
+        self.send(f'bestmove {best}')
+
+    async def stop_search(self):
+        "Stops a running search and waits until its best move has been sent"
+        if self.search_task is None:
+            return
+        self.stop_requested.set()
+        # Searcher.search clears the stop flag when it starts, so keep asking until the thread is done
+        while not self.search_task.done():
+            self.searcher.stop()
+            await asyncio.wait({self.search_task}, timeout=0.01)
+        await self.search_task
+        self.search_task = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='UCI chess engine on stdin/stdout')
+    parser.add_argument('--book', help='Polyglot opening book to play from before searching')
+    args = parser.parse_args(argv)
+
+    book = PolyglotBook(args.book) if args.book else None
+    try:
+        asyncio.run(UCIEngine(book=book).run())
+    finally:
+        if book:
+            book.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
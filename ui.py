@@ -1,7 +1,16 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pygame
 
-from constants import FILES, Position
+from constants import FILES, MOVE50_LIMIT, Position
 from chess import Board
+import instrumentation
 
 
 SCREENX, SCREENY = 530, 530
@@ -21,6 +30,12 @@ SELECTED_COLOR = (233, 233, 150)
 CHECK_COLOR = (240, 72, 72)
 LAST_MOVE_COLOR = (200, 200, 150)
 
+# Seconds the computer thinks for a hint or a move
+THINK_TIME = 2
+
+SPRITESHEET = './images/spritesheet.png'
+SPRITEMAP = './images/spritemap.txt'
+
 
 # Credits: https://www.pygame.org/wiki/Spritesheet
 class Spritesheet:
@@ -48,37 +63,43 @@ class Spritesheet:
 
 # Class for a block, usually handles all background changes when selected
 class Block(pygame.sprite.Sprite):
-    def __init__(self, pos: Position, color: bool):
+    def __init__(self, pos: Position, color: bool, dirty: set[Position] = None):
         super().__init__()
         self.pos = pos
+        # Shared set of squares to redraw, the block adds itself whenever its color changes
+        self.dirty = dirty if dirty is not None else set()
 
         # Create a rectangle of required size and color
         self.image = pygame.Surface(BLOCK_SIZE)
         self.color = COLOR2 if color else COLOR1
-        self.image.fill(self.color)
+        self.fill(self.color)
 
         self.rect = self.image.get_rect(x=BLOCK_SIZE[0]*pos.x, y=BLOCK_SIZE[1]*pos.y)
         self.selected = self.is_check = False
 
+    def fill(self, color):
+        self.image.fill(color)
+        self.dirty.add(self.pos)
+
     def select(self):
         # Change color to yellow when selected and change back to original when unselected
-        self.image.fill(SELECTED_COLOR)
+        self.fill(SELECTED_COLOR)
         if self.is_check:
-            self.image.fill(CHECK_COLOR)
+            self.fill(CHECK_COLOR)
         self.selected = True
     
     def deselect(self):
         self.selected = False
         if self.is_check:
-            self.image.fill(CHECK_COLOR)
+            self.fill(CHECK_COLOR)
         else:
-            self.image.fill(self.color)
+            self.fill(self.color)
     
     def last_move(self):
-        self.image.fill(LAST_MOVE_COLOR)
+        self.fill(LAST_MOVE_COLOR)
 
     def check(self, isCheck):
-        self.image.fill(CHECK_COLOR if isCheck else self.color)
+        self.fill(CHECK_COLOR if isCheck else self.color)
         self.is_check = isCheck
 
 
@@ -87,21 +108,34 @@ class UIManager:
     def __init__(self, board: Board):
         self.board = board
     
-        self.spritesheet = Spritesheet('./images/spritesheet.png')
-        self.spritesheet.load_spritemap('./images/spritemap.txt')
+        spritesheet = Spritesheet(SPRITESHEET)
+        spritesheet.load_spritemap(SPRITEMAP)
+        self.sprites = spritesheet.sprites
         self.font = pygame.font.SysFont(FONT, 15, True)
 
         self.board_surface = pygame.Surface(BOARD_RECT[2:])
-        self.blocks = pygame.sprite.Group()
+
+        # Only the squares in dirty are redrawn and pushed to the display each frame
+        self.dirty: set[Position] = set()
+        # Blocks indexed by [y][x] like Board.board
+        self.blocks = [[Block(Position(x, y), (x+y)%2 == 0, self.dirty) for x in range(8)] for y in range(8)]
+        self.valid_moves: set[Position] = set()
+        # Piece symbol drawn on every square, compared with the board when its hash changes
+        self.drawn = [[None] * 8 for _ in range(8)]
+        self.drawn_hash = None
 
     def get_block(self, pos: Position) -> Block:
-        return [b for b in self.blocks if b.pos == pos][0]
+        return self.blocks[pos.y][pos.x]
 
-    def create(self, screen):
-        for i in range(8):
-            for j in range(8):
-                self.blocks.add(Block(Position(i, j), (i+j)%2 == 0))
+    def square_at(self, point) -> Position:
+        "Board square under a screen coordinate, None outside the board"
+        x = int((point[0] - BOARD_RECT[0]) // BLOCK_SIZE[0])
+        y = int((point[1] - BOARD_RECT[1]) // BLOCK_SIZE[1])
+        if 0 <= x < 8 and 0 <= y < 8:
+            return Position(x, y)
+        return None
 
+    def create(self, screen):
         for i in range(1, 9):
             text_surf = self.font.render(str(9-i), 0, WHITE)
             text_rect = text_surf.get_rect(centerx=BOARD_RECT[0]/2, centery=BLOCK_SIZE[1]*i)
@@ -116,45 +150,131 @@ class UIManager:
         self.side_screen.fill('grey')
         screen.blit(self.side_screen, (board_width, 0))
 
+        # Draw every square once, later frames only redraw what changed
+        self.dirty.update(Position(x, y) for y in range(8) for x in range(8))
+        self.update(screen)
+        pygame.display.flip()
+
     def select_piece(self):
-        pos = pygame.mouse.get_pos()
-        clicked_block = [b for b in self.blocks if b.rect.move(*BOARD_RECT[:2]).collidepoint(pos)]
-        if clicked_block:
-            return self.board.get_piece(clicked_block[0].pos)
-    
-    def draw_pieces(self, surface):
-        for p in self.board.pieces:
-            img = self.spritesheet.sprites[p.symbol]
-            rect = img.get_rect(center=(BLOCK_SIZE[0] * (p.x + 0.5), BLOCK_SIZE[1] * (p.y + 0.5)))
-            surface.blit(self.spritesheet.sprites[p.symbol], rect)
+        pos = self.square_at(pygame.mouse.get_pos())
+        if pos:
+            return self.board.get_piece(pos)
 
     def show_valid_moves(self, moves):
         "Show all possible move sets as circle dots"
-        for mx, my in moves:
-            cx = int(BLOCK_SIZE[0] * (mx + 0.5))
-            cy = int(BLOCK_SIZE[1] * (my + 0.5))
-            pygame.draw.circle(self.board_surface, GREY, (cx, cy), 10)
-
-    def update(self):
-        self.blocks.draw(self.board_surface)
-        self.draw_pieces(self.board_surface)
-    
-    def draw(self, surface):
-        surface.blit(self.board_surface, BOARD_RECT)
+        moves = set(moves)
+        if moves != self.valid_moves:
+            self.dirty.update(moves ^ self.valid_moves)
+            self.valid_moves = moves
+
+    def draw_square(self, pos: Position, screen) -> pygame.Rect:
+        "Redraws the block, piece and move dot of one square, returns the screen area to update"
+        block = self.get_block(pos)
+        self.board_surface.blit(block.image, block.rect)
+        piece = self.board.get_piece(pos)
+        if piece:
+            img = self.sprites[piece.symbol]
+            self.board_surface.blit(img, img.get_rect(center=block.rect.center))
+        if pos in self.valid_moves:
+            pygame.draw.circle(self.board_surface, GREY, block.rect.center, 10)
+
+        screen_rect = block.rect.move(BOARD_RECT[:2])
+        screen.blit(self.board_surface, screen_rect, block.rect)
+        return screen_rect
+
+    def update(self, screen) -> list[pygame.Rect]:
+        "Redraws the squares that changed since the last frame, returns their screen rects"
+        if self.board.hash != self.drawn_hash:
+            # Moves, captures, castling, promotions and undos all show up as changed symbols
+            for y, row in enumerate(self.board.board):
+                for x, piece in enumerate(row):
+                    symbol = piece.symbol if piece else None
+                    if self.drawn[y][x] != symbol:
+                        self.drawn[y][x] = symbol
+                        self.dirty.add(Position(x, y))
+            self.drawn_hash = self.board.hash
+
+        rects = [self.draw_square(pos, screen) for pos in self.dirty]
+        self.dirty.clear()
+        return rects
+
+
+# Events posted by the worker thread, with the job's generation and its search result
+HINT_EVENT = pygame.event.custom_type()
+COMPUTER_MOVE_EVENT = pygame.event.custom_type()
+
+
+class Worker:
+    """
+    Runs searches on a background thread so the event loop never waits for them.
+    Results come back as pygame events, jobs submitted before the last cancel() never post theirs.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Created on the worker thread by the first search, so startup doesn't pay for the search tables
+        self.searcher = None
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        "Drops every pending job and stops the running search"
+        with self.lock:
+            self.generation += 1
+        if self.searcher:
+            self.searcher.stop()
+
+    def search(self, board: Board, event_type: int, movetime=THINK_TIME):
+        "Searches a copy of the board, the result is posted as an event_type event"
+        fen = board.get_fen_notation()
+        generation = self.generation
+
+        def run():
+            if generation != self.generation:
+                return
+            if self.searcher is None:
+                from search import Searcher
+                self.searcher = Searcher()
+
+            def on_info(_):
+                # Searcher.search clears the stop flag when it starts, so a cancel() that landed before that
+                # (or before the searcher existed) is caught here, after the first iteration
+                if generation != self.generation:
+                    self.searcher.stop()
+
+            result = self.searcher.search(Board(fen, quiet=True), movetime=movetime, on_info=on_info)
+            # The move belongs to the copy, the event carries it as UCI for the real board
+            with self.lock:
+                if generation == self.generation and result.move:
+                    pygame.event.post(pygame.event.Event(
+                        event_type, generation=generation, move=result.move.to_uci(), score=result.score
+                    ))
+
+        self.executor.submit(run)
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown()
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, first_frame_only=False):
         self.clock = pygame.time.Clock()
         self.screen = pygame.display.set_mode((SCREENX, SCREENY))
         pygame.display.set_caption('Pygame Chess')
 
-        self.board = Board()
+        # The board is printed once the first frame is up
+        self.board = Board(quiet=True)
         self.selected = None
         self.running = True
         self.piece_moves = []
 
+        # Searches for hints and computer moves, the color the computer plays (None for two players)
+        self.worker = Worker()
+        self.computer = None
+
         self.ui = UIManager(self.board)
+        # Startup benchmark: report the time of the first frame and quit
+        self.first_frame_only = first_frame_only
         self.run()
 
     def select_piece(self):
@@ -166,10 +286,10 @@ class Game:
                 self.ui.get_block(self.selected.pos).deselect()
 
             self.selected = piece
-            self.piece_moves = self.board.all_valid_moves.get(self.selected.pos, [])
+            self.piece_moves = self.board.get_piece_moves(self.selected)
             self.ui.get_block(self.selected.pos).select()
     
-    def move_selected(self, newpos: Position):
+    def move_selected(self, newpos: Position, promotion: str = None):
         # Deselect last move
         try:
             last_move = self.board.history[-1]
@@ -186,62 +306,191 @@ class Game:
         king = self.board.get_current_king()
         self.ui.get_block(king.pos).check(False)
 
-        move = self.board.move_piece(self.selected, newpos)
+        move = self.board.move_piece(self.selected, newpos, promotion)
         print(f"{self.board.turn}'s move: {move}\n")
         self.board.print_board()
 
         king = self.board.get_current_king()
         self.ui.get_block(king.pos).check(self.board.in_check)
 
+    def play(self, newpos: Position, promotion: str = None):
+        "Play the selected piece, end the game on mate or the 50 move rule, and let the computer reply"
+        # Any hint or reply being computed is about the position before this move
+        self.worker.cancel()
+        self.move_selected(newpos, promotion)
+        self.piece_moves = []
+        self.selected = None
+
+        # Mate: No move possible
+        if self.board.in_mate:
+            self.running = False
+            if self.board.in_check:
+                print("Checkmate:", self.board.turn, "has lost")
+            else:
+                print("Stalemate: It's a tie!")
+
+        if self.board.move50 >= MOVE50_LIMIT:
+            self.running = False
+            print("Tie: 50 moves without a capture or a pawn movement")
+
+        if self.running and self.board.turn == self.computer:
+            self.worker.search(self.board, COMPUTER_MOVE_EVENT)
+
+    def hint(self):
+        "Search the position in the background, the best move is selected when it arrives"
+        self.worker.cancel()
+        self.worker.search(self.board, HINT_EVENT)
+        print("Thinking...")
+
+    def toggle_computer(self):
+        "The computer takes over the side to move, or gives it back"
+        self.worker.cancel()
+        self.computer = None if self.computer else self.board.turn
+        print(f"Computer plays {self.computer}" if self.computer else "Two players")
+        if self.computer:
+            self.worker.search(self.board, COMPUTER_MOVE_EVENT)
+
+    def handle_worker_event(self, event):
+        if event.generation != self.worker.generation:
+            # Cancelled after it was posted
+            return
+        move = self.board.from_uci(event.move)
+        if self.selected:
+            self.ui.get_block(self.selected.pos).deselect()
+        self.selected = move.piece
+        if event.type == HINT_EVENT:
+            print(f"Hint: {self.board.get_san(move)} ({event.score})")
+            self.piece_moves = [move.newpos]
+            self.ui.get_block(move.oldpos).select()
+        elif self.board.turn == self.computer:
+            self.play(move.newpos, move.promotion)
+
+    def undo(self):
+        "Take back the last move and restore the board highlights"
+        if not self.board.history:
+            return
+        self.worker.cancel()
+
+        # Clear the highlights of the move being taken back
+        king = self.board.get_current_king()
+        self.ui.get_block(king.pos).check(False)
+        last_move = self.board.history[-1]
+        self.ui.get_block(last_move.oldpos).deselect()
+        self.ui.get_block(last_move.newpos).deselect()
+        if self.selected:
+            self.ui.get_block(self.selected.pos).deselect()
+        self.selected = None
+        self.piece_moves = []
+
+        self.board.undo_move()
+        print(f"Undo: {last_move.to_uci()}\n")
+        self.board.print_board()
+
+        # Highlight the move before it again
+        if self.board.history:
+            last_move = self.board.history[-1]
+            self.ui.get_block(last_move.oldpos).last_move()
+            self.ui.get_block(last_move.newpos).last_move()
+
+        king = self.board.get_current_king()
+        self.ui.get_block(king.pos).check(self.board.in_check)
+        if self.board.turn == self.computer:
+            self.worker.search(self.board, COMPUTER_MOVE_EVENT)
+
     def handle_event(self, event):
         if event.type == pygame.QUIT:
             self.running = False
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_u:
+            self.undo()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+            self.hint()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+            self.toggle_computer()
+        elif event.type in (HINT_EVENT, COMPUTER_MOVE_EVENT):
+            self.handle_worker_event(event)
+        elif self.board.turn == self.computer:
+            # Clicks are ignored while the computer is thinking
+            return
         elif event.type == pygame.MOUSEBUTTONDOWN and not self.selected:
             # If no piece is selected, select a piece
             self.select_piece()
         elif event.type == pygame.MOUSEBUTTONDOWN and self.selected:
             # else move the piece if the position is valid
-            # calculate square matrix coordinates of mouse
-            x, y = pygame.mouse.get_pos()
-            x = int((x - BOARD_RECT[0]) // BLOCK_SIZE[0])
-            y = int((y - BOARD_RECT[1]) // BLOCK_SIZE[1])
-
-            if (x, y) in self.piece_moves:
-                self.move_selected(Position(x, y))
-                self.piece_moves = []
-                self.selected = None
-
-                # Mate: No move possible
-                if self.board.in_mate:
-                    self.running = False
-                    if self.board.in_check:
-                        print("Checkmate:", self.board.turn, "has lost")
-                    else:
-                        print("Stalemate: It's a tie!")
-
-                if self.board.move50 >= 50:
-                    self.running = False
-                    print("Tie: 50 moves without a capture or a pawn movement")
+            pos = self.ui.square_at(pygame.mouse.get_pos())
+
+            if pos in self.piece_moves:
+                self.play(pos)
             else:
                 self.select_piece()
 
     def run(self):
         "Main game loop"
         self.ui.create(self.screen)
+        if self.first_frame_only:
+            print(f'FIRST_FRAME {time.time()}', flush=True)
+            self.running = False
+        else:
+            self.board.print_board()
+        idle = False
         while self.running:
-            for event in pygame.event.get():
+            # Nothing changed last frame, sleep until the next event instead of polling
+            events = [pygame.event.wait()] if idle else []
+            for event in events + pygame.event.get():
                 self.handle_event(event)
 
-            # Draw everything
-            self.ui.update()
+            # Draw and push only the squares that changed
             self.ui.show_valid_moves(self.piece_moves)
-            self.ui.draw(self.screen)
-
-            pygame.display.flip()
+            rects = self.ui.update(self.screen)
+            if rects:
+                pygame.display.update(rects)
+            idle = not rects
             self.clock.tick(FPS)
+        self.worker.close()
         pygame.quit()
 
 
+def startup_benchmark(runs: int):
+    "Launches the game runs times and reports the median time to the first frame"
+    def launch():
+        # The child times its own import of this module (pygame and the engine) before running the game
+        child = (
+            'import sys, time; start = time.time(); import ui; print("IMPORTED", start, time.time(), flush=True); '
+            'sys.exit(ui.main(["--first-frame"]))'
+        )
+        start = time.time()
+        output = subprocess.run(
+            [sys.executable, '-c', child], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout
+        lines = {line.split()[0]: line.split()[1:] for line in output.splitlines() if line.startswith(('IMPORTED', 'FIRST_FRAME'))}
+        import_start, import_end = map(float, lines['IMPORTED'])
+        first_frame = float(lines['FIRST_FRAME'][0])
+        # Interpreter start, imports, window and board setup up to the first frame
+        return first_frame - start, import_start - start, import_end - import_start, first_frame - import_end
+
+    results = sorted(launch() for _ in range(runs))
+    total, interpreter, imports, setup = (value * 1000 for value in results[len(results) // 2])
+    print(
+        f'First frame in {total:.0f}ms (median of {runs}): interpreter {interpreter:.0f}ms, '
+        f'imports {imports:.0f}ms, setup and first frame {setup:.1f}ms'
+    )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Two player chess game')
+    parser.add_argument('--startup-benchmark', type=int, metavar='RUNS', help='measure the time to the first frame')
+    parser.add_argument('--first-frame', action='store_true', help=argparse.SUPPRESS)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.profiling(args.profile, args.stats):
+        if args.startup_benchmark:
+            return startup_benchmark(args.startup_benchmark)
+        pygame.init()
+        Game(first_frame_only=args.first_frame)
+        return 0
+
+
 if __name__ == "__main__":
-    pygame.init()
-    game = Game()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import argparse
+import json
+import sys
+import time
+
+from chess import Board
+from constants import STARTING_FEN
+import instrumentation
+
+
+# Statuses in which the player to move has no legal move
+GAME_OVER = ('checkmate', 'stalemate')
+
+
+def validate_moves(fen: str, moves: list[str]) -> dict:
+    """
+    Plays a transcript of UCI moves from a FEN with Board.push_uci, no SAN is generated.
+    Returns valid, the final fen and status, or the index, move and reason of the first illegal move.
+    """
+    try:
+        board = Board(fen or STARTING_FEN, quiet=True)
+    except (ValueError, IndexError, KeyError):
+        return {'valid': False, 'index': None, 'move': None, 'error': f'Invalid FEN: {fen}'}
+
+    for index, uci in enumerate(moves):
+        # The 50 move rule is a draw that can be claimed, moves after it are still legal
+        try:
+            board.push_uci(uci)
+        except ValueError as e:
+            status = board.status()
+            return {
+                'valid': False, 'index': index, 'move': uci,
+                'error': f'Game is over ({status}): {uci}' if status in GAME_OVER else str(e),
+                'fen': board.get_fen_notation(), 'status': status,
+            }
+    return {'valid': True, 'plies': len(moves), 'fen': board.get_fen_notation(), 'status': board.status()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate transcripts of UCI moves')
+    parser.add_argument(
+        'transcripts', nargs='?', default='-',
+        help='JSONL file of {"fen": ..., "moves": [...] or "e2e4 e7e5 ..."} lines, stdin by default'
+    )
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.profiling(args.profile, args.stats):
+        f = sys.stdin if args.transcripts == '-' else open(args.transcripts)
+        count = invalid = moves = 0
+        start = time.perf_counter()
+        for line in f:
+            if not line.strip():
+                continue
+            transcript = json.loads(line)
+            ucis = transcript.get('moves', [])
+            if isinstance(ucis, str):
+                ucis = ucis.split()
+            result = validate_moves(transcript.get('fen'), ucis)
+            print(json.dumps(result))
+            count += 1
+            invalid += not result['valid']
+            moves += result['plies'] if result['valid'] else result['index'] or 0
+        elapsed = time.perf_counter() - start
+        if f is not sys.stdin:
+            f.close()
+
+        print(
+            f'Transcripts: {count} ({invalid} invalid), {moves} moves in {elapsed:.3f}s '
+            f'({elapsed / moves * 1e6 if moves else 0:.1f}us per move)', file=sys.stderr
+        )
+        return 1 if invalid else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import random
+
+
+# Fixed seed so hashes are stable between runs and processes
+_random = random.Random(0x5EED)
+
+PIECE_KEYS = {symbol: [_random.getrandbits(64) for _ in range(64)] for symbol in 'PNBRQKpnbrqk'}
+# Xor-ed in when black is to move
+TURN_KEY = _random.getrandbits(64)
+# One key per en passant file
+EP_KEYS = [_random.getrandbits(64) for _ in range(8)]
+
+# One key per castling right (K, Q, k, q), combined for each of the 16 possible sets of rights
+_CASTLING_RIGHT_KEYS = [_random.getrandbits(64) for _ in range(4)]
+CASTLING_KEYS = []
+for rights in range(16):
+    key = 0
+    for i, right_key in enumerate(_CASTLING_RIGHT_KEYS):
+        if rights >> i & 1:
+            key ^= right_key
+    CASTLING_KEYS.append(key)
+
+
+def castling_rights(board) -> int:
+    "Castling rights of the board as a 4 bit mask (K, Q, k, q)"
+    white_king, black_king = board.kings['WHITE'], board.kings['BLACK']
+    return (
+        (white_king.castling[1] is not None)
+        | (white_king.castling[0] is not None) << 1
+        | (black_king.castling[1] is not None) << 2
+        | (black_king.castling[0] is not None) << 3
+    )
+
+
+def state_key(board) -> int:
+    "Part of the hash that does not depend on piece placement"
+    key = CASTLING_KEYS[castling_rights(board)]
+    if board.ep_square:
+        key ^= EP_KEYS[board.ep_square.x]
+    if board.turn == 'BLACK':
+        key ^= TURN_KEY
+    return key
+
+
+def compute_hash(board) -> int:
+    "Computes the zobrist hash of a board from scratch"
+    key = state_key(board)
+    for piece in board.pieces:
+        key ^= PIECE_KEYS[piece.symbol][piece.sq]
+    return key